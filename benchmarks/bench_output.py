@@ -0,0 +1,154 @@
+# iosapplist
+# A Python package that lists iOS App Store apps.  (Formerly part of AppBackup.)
+#
+# Copyright (C) 2008-2014 Scott Zeid
+# https://s.zeid.me/projects/appbackup/
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# 
+# Except as contained in this notice, the name(s) of the above copyright holders
+# shall not be used in advertising or otherwise to promote the sale, use or
+# other dealings in this Software without prior written authorization.
+
+# Micro-benchmark for CLI output items
+#
+# Usage:  python benchmarks/bench_output.py [number-of-apps] [repeat]
+#
+# Makes a synthetic iOS 8 root with the given number of apps (default: 10000)
+# in a temporary directory, and then times `ls` and `--robot json ls` over it
+# with the current output item type and with the old one, which defined a new
+# class for each item.  Making and reading that many items by themselves is
+# also timed, since the scan takes up most of the time of `ls`.
+
+from __future__ import with_statement
+
+import os
+import plistlib
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+# the repository root, which has the iosapplist package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from iosapplist.cli import CLI
+from iosapplist.cli.engine import output
+
+
+METADATA_PLIST = ".com.apple.mobile_container_manager.metadata.plist"
+
+
+def make_root(root, n):
+ bundles = os.path.join(root, "Containers", "Bundle", "Application")
+ data    = os.path.join(root, "Containers", "Data",   "Application")
+ for i in xrange(n):
+  bundle_id = "com.example.app%d" % i
+  bundle = os.path.join(bundles, str(uuid.uuid4()).upper())
+  os.makedirs(os.path.join(bundle, "App%d.app" % i))
+  plistlib.writePlist({"MCMMetadataContentClass": 1,
+                       "MCMMetadataIdentifier": bundle_id},
+                      os.path.join(bundle, METADATA_PLIST))
+  plistlib.writePlist({"CFBundleIdentifier": bundle_id,
+                       "CFBundleDisplayName": "App %d" % i},
+                      os.path.join(bundle, "App%d.app" % i, "Info.plist"))
+  container = os.path.join(data, str(uuid.uuid4()).upper())
+  os.makedirs(container)
+  plistlib.writePlist({"MCMMetadataContentClass": 2,
+                       "MCMMetadataIdentifier": bundle_id},
+                      os.path.join(container, METADATA_PLIST))
+
+
+class OldOutputItem(object):
+ # The old output item type, which made a new class for each item
+ def __new__(cls, type, value, human):
+  class item(cls):
+   def __new__(item_cls):
+    return object.__new__(item_cls)
+   @property
+   def type(self):
+    return type
+   @property
+   def value(self):
+    return value
+   @property
+   def human(self):
+    return human
+  return item()
+
+
+def run(argv, item_type, repeat):
+ output._OutputItem, old = item_type, output._OutputItem
+ stdout = sys.stdout
+ try:
+  best = None
+  with open(os.devnull, "w") as devnull:
+   for i in xrange(repeat):
+    sys.stdout = devnull
+    start = time.time()
+    CLI().start(argv)
+    elapsed = time.time() - start
+    best = elapsed if best is None else min(best, elapsed)
+ finally:
+  sys.stdout = stdout
+  output._OutputItem = old
+ return best
+
+
+def run_items(n, item_type, repeat):
+ best = None
+ for i in xrange(repeat):
+  start = time.time()
+  for j in xrange(n):
+   item = item_type("normal", j, None)
+   item.type, item.value, item.human
+  elapsed = time.time() - start
+  best = elapsed if best is None else min(best, elapsed)
+ return best
+
+
+def report(label, old, new):
+ print "%-24s  old: %.3fs  new: %.3fs  (%.1f%% faster)" % (
+  label, old, new, (old - new) / old * 100
+ )
+
+
+def main(argv=sys.argv):
+ n = int(argv[1]) if len(argv) > 1 else 10000
+ repeat = int(argv[2]) if len(argv) > 2 else 3
+ root = tempfile.mkdtemp(prefix="iosapplist-bench-")
+ try:
+  report("%d items" % n, run_items(n, OldOutputItem, repeat),
+                          run_items(n, output._OutputItem, repeat))
+  print "making a root with %d apps in %s" % (n, root)
+  make_root(root, n)
+  for argv in (["-r", root, "ls"], ["--robot", "json", "-r", root, "ls"]):
+   new = run(argv, output._OutputItem, repeat)
+   old = run(argv, OldOutputItem, repeat)
+   report(" ".join(argv[:-3] + argv[-1:]), old, new)
+ finally:
+  shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+ try:
+  sys.exit(main(sys.argv))
+ except KeyboardInterrupt:
+  pass
@@ -36,7 +36,9 @@ __version__ = "3.0.dev30"
 
 codename    = "Maserati"  # git push all maserati
 
-from applist import AppList, AppListError
+from applist import AppList, AppListError, AppListEvent
+from apptable import AppTable, AppRow
 from __main__ import main
 
-__all__     = ["AppList", "AppListError", "main"]
+__all__     = ["AppList", "AppListError", "AppListEvent", "AppTable", "AppRow",
+               "main"]
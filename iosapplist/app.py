@@ -30,10 +30,11 @@
 
 from __future__ import with_statement
 
-import os
+import operator
 import string
 
 from container import ContainerError, Container, ContainerClass, ContainerRoot
+from util import fs
 from util import propertylist
 from util import *
 
@@ -47,6 +48,32 @@ class Template(string.Template):
 class AppError(Exception): pass
 
 
+def _row_getter(fields, _getters={}):
+ # Returns a function that returns a tuple of the given attributes of an object
+ getter = _getters.get(fields, None)
+ if getter is None:
+  if len(fields) == 1:
+   attr = operator.attrgetter(fields[0])
+   getter = lambda obj: (attr(obj),)
+  else:
+   getter = operator.attrgetter(*fields)
+  _getters[fields] = getter
+ return getter
+
+
+# The types of values that are exported by default (see App.field_plan())
+_export_types = (basestring, int, long, float, list, tuple, bool, None.__class__)
+
+
+class _AppContainers(object):
+ # The type of App.containers
+ __slots__ = ["bundle", "data"]
+ 
+ def __init__(self, bundle, data):
+  self.bundle = bundle
+  self.data   = data
+
+
 class App(object):
  """Describes an App Store app.
 
@@ -86,9 +113,83 @@ dictionary style as well as attribute style.
  
  info_tpl = u"$friendly ($bundle_id)"
  
+ # The keys in the app's Info.plist file that this class actually uses.
+ # Subclasses that read other keys should add them here; otherwise, they
+ # will be missing, since only these keys are read from Info.plist.
+ info_plist_keys = ("CFBundleIdentifier", "CFBundleDisplayName")
+ 
+ # The attributes that need Info.plist to be read, and the ones that need the
+ # app bundle to be found (see needs()).  Subclasses should add theirs here.
+ info_plist_fields = ("friendly", "sort_key", "useable")
+ # the attributes that lazy_class() loads when they are first read
+ lazy_fields = ("name", "friendly", "sort_key", "useable")
+ # attributes that are not exported by to_dict() and the dict-alike methods
+ plan_blacklist = ("containers", "info_tpl")
+ bundle_fields     = ("name",)
+ 
+ @classmethod
+ def needs(cls, fields, lazy=False):
+  """Returns whether the given attributes need the app bundle to be found and
+whether they need Info.plist to be read, as a tuple of two bools.  If fields
+is None, then all attributes are needed, or none if lazy is True (see
+__init__()).
+
+"""
+  if fields is None:
+   return not lazy, not lazy
+  fields = set(fields)
+  needs_info_plist = bool(fields.intersection(cls.info_plist_fields))
+  needs_bundle = needs_info_plist or bool(fields.intersection(cls.bundle_fields))
+  return needs_bundle, needs_info_plist
+ 
+ @classmethod
+ def lazy_class(cls):
+  """Returns the subclass of this class that apps made with lazy=True belong to
+(see __init__()).
+
+Only that subclass loads attributes when they are first read, so apps that are
+not lazy don't pay for the check on every attribute access.  It is made the
+first time it is asked for and kept on the class.
+
+"""
+  if isinstance(cls.__dict__.get("name", None), _LazySlot):
+   return cls
+  lazy_cls = cls.__dict__.get("_lazy_class", None)
+  if lazy_cls is None:
+   attrs = dict(__slots__=[], __module__=cls.__module__, __doc__=cls.__doc__)
+   for attr in App.lazy_fields:
+    attrs[attr] = _LazySlot(App.__dict__[attr])
+   lazy_cls = type("Lazy" + cls.__name__, (cls,), attrs)
+   cls._lazy_class = lazy_cls
+  return lazy_cls
+ 
  def __nonzero__(self):
   return bool(self.__ready)
  
+ @classmethod
+ def field_plan(cls):
+  """Returns a tuple of the names of the attributes that are exported, in order.
+
+These are the attributes that to_dict(), to_row(), and the dict-alike methods
+use.  They are the public attributes in the __slots__ of App and its subclasses,
+other than the ones in plan_blacklist, and are only worked out once per class.
+Those methods leave out attributes whose values are not strings, numbers,
+lists, tuples, bools, or None (to_row() gives None for them instead, so that
+the columns still line up with the plan).
+
+"""
+  plan = cls.__dict__.get("_field_plan", None)
+  if plan is None:
+   plan = []
+   for klass in reversed(cls.__mro__):
+    if issubclass(klass, App):
+     for attr in klass.__dict__.get("__slots__", ()):
+      if (not attr.startswith("_") and attr not in cls.plan_blacklist
+          and attr not in plan):
+       plan.append(attr)
+   plan = cls._field_plan = tuple(plan)
+  return plan
+ 
  @classmethod
  def slot_names(cls):
   """Returns a mapping of attribute names to human-readable descriptions."""
@@ -110,11 +211,10 @@ dictionary style as well as attribute style.
   # the need to have to iterate through the cache to make the App objects
   # once the containers are discovered and then replace each cache entry
   # with the App.
+  if kwargs.get("lazy", False):
+   cls = cls.lazy_class()
   self = super(App, cls).__new__(cls, bundle_container, data_container)
-  class containers(object):
-   bundle = bundle_container
-   data   = data_container
-  self.containers = containers = containers()
+  self.containers = _AppContainers(bundle_container, data_container)
   self.bundle_id = None
   self.__ready = self.__dummy = False
   return self
@@ -131,7 +231,25 @@ Data container.
 On iOS <= 7.x, bundle_container and data_container should be equal to
 each other and should have the ContainerClass LEGACY.
 
+The keyword argument fields, if given, is a collection of the attributes that
+are actually needed (see needs()).  If none of them come from Info.plist, then
+Info.plist is not read and friendly, sort_key, and useable are set to None,
+and bundle_id comes from the bundle container.  If name is not needed either,
+then the app bundle is not looked for (so the app is not checked for having
+one) and name is also None.
+
+If the keyword argument lazy is True, then the attributes that are not needed
+(all of them if fields is not given) are loaded from the app bundle the first
+time one of them is read, instead of being set to None.  bundle_id always
+comes from the bundle container in that case, and if the app bundle or its
+Info.plist turns out to be missing or invalid, then useable will be False
+(and name will be None if there is no app bundle) instead of an AppError
+being raised.  Such apps are instances of lazy_class().
+
 """
+  fields = kwargs.pop("fields", None)
+  lazy = bool(kwargs.pop("lazy", False))
+  needs_bundle, needs_info_plist = self.needs(fields, lazy)
   try:
    if not isinstance(bundle_container, Container):
     bundle_container = Container(bundle_container)
@@ -160,39 +278,76 @@ each other and should have the ContainerClass LEGACY.
   if containers.bundle.bundle_id != containers.data.bundle_id:
    raise AppError("The bundle and data containers have different bundle IDs.")
   
+  if not needs_info_plist:
+   self.bundle_id = containers.bundle.bundle_id
+   if not lazy:
+    self.name = self.friendly = self.sort_key = self.useable = None
+   if needs_bundle:
+    self.name = containers.bundle.find_app_bundle()[0]
+    if not self.name: raise AppError("This is not a valid iOS App Store app.")
+   self.__ready = True
+   return
+  
+  self.__load_info()
+  self.__ready = True
+ 
+ def __load_info(self):
+  # Sets bundle_id, name, friendly, sort_key, and useable from the app bundle
+  name, bundle_id, friendly, useable = self.__read_info()
+  self.name      = name
+  self.bundle_id = bundle_id
+  self.friendly  = friendly
+  self.sort_key  = u"%s_%s" % (strip_latin_diacritics(friendly.lower()),
+                               to_unicode(bundle_id, errors="ignore"))
+  self.useable   = useable
+ 
+ def __read_info(self):
+  # Returns the name, bundle_id, friendly, and useable values from the app
+  # bundle without setting any of them, so that other threads never see
+  # half-loaded values (see __load_lazily())
+  containers = self.containers
+  
   # find the Info.plist file
-  info_plist = ""
-  for i in os.listdir(containers.bundle.path):
-   app_dir = os.path.realpath(os.path.join(containers.bundle.path, i))
-   if (os.path.isdir(app_dir) and i.endswith(u".app")):
-    self.name = i
-    info_plist = os.path.join(app_dir, u"Info.plist")
-    break
+  name, info_plist = containers.bundle.find_app_bundle()
   if not info_plist: raise AppError("This is not a valid iOS App Store app.")
   
-  self.bundle_id = "invalid.appbackup.corrupted"
-  self.friendly  = to_unicode(self.name.rsplit(u".app", 1)[0], errors="ignore")
-  self.sort_key  = u"%s_%s" % (strip_latin_diacritics(self.friendly.lower()),
-                               to_unicode(self.bundle_id, errors="ignore"))
-  self.useable   = False
+  bundle_id = "invalid.appbackup.corrupted"
+  friendly  = to_unicode(name.rsplit(u".app", 1)[0], errors="ignore")
+  useable   = False
   
   try:
-   if os.path.isfile(os.path.realpath(info_plist)):
-    pl = propertylist.load(info_plist)
+   if fs.isfile(info_plist):
+    pl = propertylist.load_keys(info_plist, self.info_plist_keys)
     if "CFBundleIdentifier" in pl:
-     self.bundle_id = pl["CFBundleIdentifier"]
-     if self.bundle_id != containers.bundle.bundle_id:
+     bundle_id = pl["CFBundleIdentifier"]
+     if bundle_id != containers.bundle.bundle_id:
       raise AppError("The bundle ID in Info.plist does not match the bundle ID"
 	             " of the bundle container.")
-     self.friendly  = to_unicode(pl.get("CFBundleDisplayName", "").strip() or
-                                 self.name.rsplit(u".app", 1)[0], errors="ignore")
-     self.sort_key  = u"%s_%s" % (strip_latin_diacritics(self.friendly.lower()),
-                                  to_unicode(self.bundle_id, errors="ignore"))
-     self.useable   = True
+     friendly  = to_unicode(pl.get("CFBundleDisplayName", "").strip() or
+                            name.rsplit(u".app", 1)[0], errors="ignore")
+     useable   = True
   except propertylist.PropertyListError:
    pass
-  
-  self.__ready = True
+  return name, bundle_id, friendly, useable
+ 
+ def __load_lazily(self, attr):
+  # Called by _LazySlot when a lazily-loaded attribute has not been set yet.
+  # bundle_id (which always comes from the bundle container here) is left
+  # alone, since other threads might be reading it.
+  bundle_id = self.bundle_id
+  try:
+   name, info_bundle_id, friendly, useable = self.__read_info()
+  except AppError:
+   name = self.containers.bundle.find_app_bundle()[0]
+   friendly = to_unicode((name or "").rsplit(u".app", 1)[0] or bundle_id,
+                         errors="ignore")
+   useable = False
+  if not _LazySlot.is_set(type(self).name, self):
+   self.name = name
+  self.friendly  = friendly
+  self.sort_key  = u"%s_%s" % (strip_latin_diacritics(friendly.lower()),
+                               to_unicode(bundle_id, errors="ignore"))
+  self.useable   = useable
  
  @property
  def bundle_path(self):
@@ -214,14 +369,17 @@ each other and should have the ContainerClass LEGACY.
  
  def info_str(self, verbose=True):
   info_tpl = self.info_tpl.split(":", 1)[0] if verbose else self.info_tpl
-  info = Template(info_tpl).safe_substitute(dict(self))
+  values = self.to_dict()
+  info = Template(info_tpl).safe_substitute(values)
   if verbose:
-   blacklist = ("info_tpl", "bundle_id", "friendly", "sort_key")
-   key_names = [key for key in self.iterkeys() if key not in blacklist]
    padding = reversed(sorted([len(name) for name in self.slot_names().values()])).next()
    padding += 2
    info += ":\n"
-   for attr, value in self.iteritems():
+   for attr in self.field_plan():
+    # to_dict() leaves out values that it can't export
+    if attr not in values:
+     continue
+    value = values[attr]
     if attr not in ("bundle_id", "friendly", "sort_key"):
      name = self.slot_names().get(attr, None)
      if name:
@@ -230,10 +388,25 @@ each other and should have the ContainerClass LEGACY.
       info += u"%s:  %s\n" % (name, to_unicode(value))
   return info
  
+ def to_dict(self, fields=None):
+  """Returns a dictionary of the given attributes (default: field_plan())."""
+  if fields is None:
+   return dict(self.iteritems())
+  fields = tuple(fields)
+  return dict(zip(fields, _row_getter(fields)(self)))
+ 
+ def to_row(self, fields=None):
+  """Returns a tuple of the given attributes (default: field_plan())."""
+  if fields is None:
+   return tuple([value if isinstance(value, _export_types) else None
+                 for value in _row_getter(self.field_plan())(self)])
+  return _row_getter(tuple(fields))(self)
+ 
  # Dict-alike methods
  
  def __contains__(self, key):
-  return key in self.iterkeys()
+  return (key in self.field_plan() and
+          isinstance(getattr(self, key), _export_types))
  
  def __getitem__(self, key):
   return getattr(self, key)
@@ -242,15 +415,10 @@ each other and should have the ContainerClass LEGACY.
   return list(self.iteritems())
  
  def iteritems(self):
-  types = (basestring, int, long, float, list, tuple, bool, None.__class__)
-  blacklist = ("info_tpl",)
-  for cls in reversed(self.__class__.__mro__):
-   if issubclass(cls, App):
-    for attr in cls.__slots__:
-     if not attr.startswith("_") and attr not in blacklist:
-      value = getattr(self, attr)
-      if isinstance(value, types):
-       yield (attr, value)
+  fields = self.field_plan()
+  for item in zip(fields, _row_getter(fields)(self)):
+   if isinstance(item[1], _export_types):
+    yield item
   raise StopIteration
  
  def iterkeys(self):
@@ -268,3 +436,35 @@ each other and should have the ContainerClass LEGACY.
  
  def values(self):
   return list(self.itervalues())
+
+
+class _LazySlot(object):
+ # Wraps the slot descriptor of an App attribute that can be loaded lazily, and
+ # asks the App to load it the first time it is read if it has not been set
+ def __init__(self, slot):
+  self.slot = slot
+  self.__name__ = slot.__name__
+  self.__doc__ = slot.__doc__
+ 
+ def __get__(self, obj, cls=None):
+  if obj is None:
+   return self
+  try:
+   return self.slot.__get__(obj, cls)
+  except AttributeError:
+   obj._App__load_lazily(self.__name__)
+   return self.slot.__get__(obj, cls)
+ 
+ def __set__(self, obj, value):
+  self.slot.__set__(obj, value)
+ 
+ def __delete__(self, obj):
+  self.slot.__delete__(obj)
+ 
+ @staticmethod
+ def is_set(lazy_slot, obj):
+  try:
+   lazy_slot.slot.__get__(obj, type(obj))
+   return True
+  except AttributeError:
+   return False
@@ -30,22 +30,202 @@
 
 from __future__ import with_statement
 
+import bisect
+import fnmatch
+import heapq
+import itertools
+import operator
 import os
+import re
+import threading
+import time
 
-from app import AppError, App
-from container import ContainerError, Container, ContainerRoot
+try:
+ from multiprocessing.pool import ThreadPool
+except ImportError:
+ ThreadPool = None
+
+from app import AppError, App, _row_getter
+from container import ContainerError, Container, ContainerClass, ContainerRoot
+from container import CONTAINER_METADATA_KEYS, CONTAINER_METADATA_PLIST
+from container import find_app_bundle
+from scancache import ScanCache
+from util import fs
+from util import inotify
 from util import propertylist
 from util import *
 
-__all__ = ["AppListError", "AppList"]
+__all__ = ["AppListError", "AppList", "AppListEvent", "parse_where"]
 
 
 class AppListError(Exception): pass
 
 
+_UUID_RE = re.compile(r"^[0-9a-f]{8}(-[0-9a-f]{4}){3}-[0-9a-f]{12}$", re.I)
+_WHERE_RE = re.compile(r"^\s*(!?)\s*([A-Za-z_][\w-]*)\s*(?:(!=|\^=|~=|=)(.*))?$",
+                       re.S)
+
+
+def parse_where(expression):
+ """Parses a condition for AppList.where() and returns a (key, op, value) tuple.
+
+The condition can be one of:
+
+ key=value   the key's value is value
+ key!=value  the key's value is not value
+ key^=value  the key's value starts with value
+ key~=value  the key's value contains value, ignoring case
+ key         the key's value is true (e.g. "useable")
+ !key        the key's value is false
+
+Dashes in key are changed to underscores.  For the last two forms, op is
+"is" and value is True or False.  Raises ValueError if the condition is not
+in one of these forms.
+
+"""
+ m = _WHERE_RE.search(to_unicode(expression, errors="ignore"))
+ if not m or (m.group(1) and m.group(3)):
+  raise ValueError("invalid condition " + repr(expression))
+ negate, key, op, value = m.groups()
+ key = str(key.replace("-", "_"))
+ if not op:
+  return (key, "is", not negate)
+ return (key, op, value)
+
+
+def _where_text(value):
+ # Converts an App attribute value to the Unicode string that conditions use
+ if value is True or value is False:
+  return u"true" if value else u"false"
+ if value is None:
+  return u""
+ return to_unicode(value, errors="ignore")
+
+
+def _where_test(app, condition):
+ key, op, value = condition
+ return _where_test_value(getattr(app, key), op, value)
+
+
+def _where_test_value(attr_value, op, value):
+ if op == "is":
+  return bool(attr_value) == value
+ text = _where_text(attr_value)
+ if op == "=":
+  return text == value
+ elif op == "!=":
+  return text != value
+ elif op == "^=":
+  return text.startswith(value)
+ elif op == "~=":
+  return value.lower() in text.lower()
+ raise ValueError("invalid operator " + repr(op))
+
+
+class AppListEvent(object):
+ """Describes a change found by AppList.watch().
+
+Attributes:
+ type:      "added", "removed", or "changed"
+ bundle_id: the bundle ID of the app
+ app:       the App (or subclass) instance; for "removed" events, this is the
+             instance that was removed from the AppList
+
+"""
+ __slots__ = ["type", "bundle_id", "app"]
+ 
+ def __init__(self, type, bundle_id, app):
+  self.type      = type
+  self.bundle_id = bundle_id
+  self.app       = app
+ 
+ def __repr__(self):
+  return "<%s (%s): %s>" % (self.__class__.__name__, self.type, repr(self.bundle_id))
+
+
+def _map(func, items, workers=None):
+ # Like map(), but spreads the calls across a pool of up to `workers` threads
+ # if workers > 1.  Results are always returned in the same order as items.
+ items = list(items)
+ if ThreadPool is None or not workers or workers <= 1 or len(items) <= 1:
+  return map(func, items)
+ func = propertylist.with_preloaded(func)
+ pool = ThreadPool(min(workers, len(items)))
+ try:
+  return pool.map(func, items)
+ finally:
+  pool.close()
+  pool.join()
+
+
+def _imap(func, items, workers=None):
+ # Like _map(), but returns an iterator that yields each result as soon as it
+ # (and all of the results before it) are ready.
+ items = list(items)
+ if ThreadPool is None or not workers or workers <= 1 or len(items) <= 1:
+  for item in items:
+   yield func(item)
+  return
+ func = propertylist.with_preloaded(func)
+ pool = ThreadPool(min(workers, len(items)))
+ try:
+  for result in pool.imap(func, items):
+   yield result
+ finally:
+  pool.terminate()
+  pool.join()
+
+
+def _make_container(path, find_bundle=True):
+ try:
+  return Container(path, find_bundle)
+ except ContainerError:
+  return None
+
+
+def _info_plist(path):
+ try:
+  return find_app_bundle(path)[1]
+ except OSError:
+  return None
+
+
+def _container_signature(path, container=None):
+ # Returns what refresh() compares to tell if a container directory changed.
+ # container is the Container made for path before, if any (see
+ # _info_signature()).
+ return (file_signature(path),
+         file_signature(os.path.join(path, CONTAINER_METADATA_PLIST)),
+         _info_signature(container))
+
+
+def _info_signature(container):
+ # Returns the part of a container's signature for its app's Info.plist, which
+ # is needed because updating an app in place (e.g. in a legacy container)
+ # might not change anything else that is stat()ed.  The app bundle is taken
+ # from the Container, so the directory is not listed again.  Data containers
+ # (and containers that could not be loaded) have none.
+ if container is None or container.class_ not in (ContainerClass.BUNDLE,
+                                                  ContainerClass.LEGACY):
+  return None
+ info_plist = container.find_app_bundle()[1]
+ return file_signature(info_plist) if info_plist else None
+
+
+def _preload(filenames, keys, processes=None, cache=None):
+ # Decodes the given plists, in a process pool if processes > 1 and using the
+ # persistent cache if given, for use with propertylist.preloaded().
+ filenames = [filename for filename in filenames if filename]
+ if not processes or processes <= 1:
+  processes = 1
+ if cache:
+  return cache.load_many(filenames, keys, processes)
+ return propertylist.load_many(filenames, keys, processes)
+
+
 class AppList(object):
  def __init__(self, root, app_class=App, *args, **kwargs):
-  """Creates the app list and builds the cache.
+  """Creates the app list.
 
 The root can be "/var/mobile", an iOS 8 "Containers" directory, its "Bundle"
 or "Data" subdirectories, their "Application" subdirectory, the "Applications"
@@ -56,12 +236,77 @@ app_class is the class to instantiate for each app.  It can be App (the default)
 or a subclass of App.  Extra positional or keyword arguments will be passed to
 the constructor of app_class each time an app_class instance is made.
 
+The keyword argument workers, if given, is the default number of threads that
+find_all() will use to scan containers and load apps concurrently.  It is not
+passed to app_class.  None, 0, or 1 (the default) means to scan serially.
+
+The keyword argument processes, if given, is the default number of worker
+processes that find_all() will use to decode plist files.  It is not passed to
+app_class either.
+
+The keyword argument cache_dir, if given, is a directory in which to keep a
+persistent cache of the plist values read by find_all() (see ScanCache).  There
+is one cache file per root path.  Containers whose plists are unchanged since
+the last scan are then rebuilt from the cache without parsing any plists.
+It is not passed to app_class either.
+
+The keyword argument miss_ttl, if given, is the number of seconds for which
+a query that could not be found by find_many() or self[query] is remembered,
+so that looking it up again does not re-create the cache.  The default is 10,
+and 0 turns this off.  It is not passed to app_class either.
+
+The keyword argument fields, if given, is a collection of the App attributes
+that are needed.  It is passed to app_class (see App.__init__() and
+App.needs()), and scans skip the work that those attributes do not need:
+Info.plist files are only read if an attribute needs them, and iOS >= 8 bundle
+containers are only listed to find the app bundle if an attribute needs it.
+Attributes that are not needed might be None.
+
+The keyword argument lazy, if True, is also passed to app_class, and makes the
+attributes that are not in fields (all of them if fields is not given) load
+from the app bundle the first time they are read (see App.__init__()).  Scans
+then only read the container metadata (and on iOS <= 7.x, Info.plist for the
+bundle ID).
+
 """
   self.root = root if isinstance(root, ContainerRoot) else ContainerRoot(root)
+  self.workers = kwargs.pop("workers", None)
+  self.processes = kwargs.pop("processes", None)
+  self.cache_dir = kwargs.pop("cache_dir", None)
+  self.miss_ttl = kwargs.pop("miss_ttl", 10)
+  self.fields = kwargs.pop("fields", None)
+  if self.fields is not None:
+   self.fields = frozenset(self.fields)
+   kwargs["fields"] = self.fields
+  self.lazy = bool(kwargs.pop("lazy", False))
+  if self.lazy:
+   kwargs["lazy"] = True
   self.app_class = app_class
   self.app_args = args
   self.app_kwargs = kwargs
+  self.sort_keys = {}
   self.__cache = {}
+  self.__hints = None
+  self.__scan_lock = threading.RLock()
+  self.scan_syscalls = {}
+ 
+ def projected(self, fields):
+  """Returns a new AppList with the same settings but the given fields.
+
+The new list has its own (empty) cache.  See the constructor for fields.
+
+"""
+  kwargs = dict(self.app_kwargs)
+  kwargs.pop("fields", None)
+  kwargs.pop("lazy", None)
+  return self.__class__(self.root, self.app_class, *self.app_args,
+                        workers=self.workers, processes=self.processes,
+                        cache_dir=self.cache_dir, miss_ttl=self.miss_ttl,
+                        fields=fields, lazy=self.lazy, **kwargs)
+ 
+ def __make_container(self, path):
+  needs_bundle = self.app_class.needs(self.fields, self.lazy)[0]
+  return _make_container(path, find_bundle=needs_bundle)
  
  def __list(self):
   if not self:
@@ -70,27 +315,21 @@ the constructor of app_class each time an app_class instance is made.
  
  def __contains__(self, item):
   try:
-   self.__getitem__(self, item)
+   self.__getitem__(item)
    return True
   except KeyError:
    pass
   return False
  
- def __getitem__(self, item, _recursing=False):
-  if self.__cache:
-   if isinstance(item, (int, long)):
-    return self.__cache["as_list"][item]
-   else:
-    match = self.__cache["by_bundle_id"].get(item, None)
-    if match:
-     return match
-    match = self.__cache["by_uuid"].get(item, None)
-    if match:
-     return match
-    if not _recursing:
-     self.find_all()
-     return self.__getitem__(item, _recursing=True)
-  raise KeyError(repr(item))
+ def __getitem__(self, item):
+  if isinstance(item, (int, long)):
+   if not self:
+    self.find_all()
+   return self.__cache["as_list"][item]
+  match = self.find_many([item])[0]
+  if match is None:
+   raise KeyError(repr(item))
+  return match
  
  def __iter__(self):
   return self.__list().__iter__()
@@ -109,12 +348,239 @@ the constructor of app_class each time an app_class instance is made.
   except KeyError:
    return default
  
+ def find_many(self, queries):
+  """Finds an App (or subclass) instance for each of the given queries.
+
+Returns a list with the App (or subclass) instance that matches each query,
+in the same order as queries, with None in place of each query that could
+not be matched.  Each query is a bundle ID, a UUID, or an index into the
+cache, as with self[query], except that indexes out of range give None.
+
+Queries are first looked up in the cache.  If the cache has not been created
+yet, then probe() is tried instead for a single query, but for more than one
+query it is only tried for the queries that the bundle ID hints point straight
+to, so that a batch never searches the container roots once per query.  After
+that, the cache is created or re-created at most once for all of the queries
+that were not found, and any queries that still cannot be found are remembered
+for miss_ttl seconds (see the constructor), during which looking them up again
+will not re-create the cache.  The remembered misses are forgotten whenever the
+cache changes.
+
+"""
+  queries = list(queries)
+  results = [None] * len(queries)
+  pending = range(len(queries))
+  made_cache = False
+  if not self:
+   strings = [i for i in pending
+              if isinstance(queries[i], basestring) and queries[i]]
+   if strings:
+    hints = self.__load_hints()
+    single = len(queries) == 1
+    if not single:
+     hint_uuids = set()
+     for pair in hints.itervalues():
+      hint_uuids.update([uuid.upper() for uuid in pair if uuid])
+    for i in strings:
+     query = queries[i]
+     is_uuid = _UUID_RE.search(query)
+     if not single:
+      if is_uuid and query.upper() not in hint_uuids:
+       continue
+      if not is_uuid and query not in hints:
+       continue
+     if is_uuid:
+      results[i] = self.__probe(None, query, hints, single)
+     else:
+      results[i] = self.__probe(query, None, hints, single)
+   pending = [i for i in pending if results[i] is None]
+   if pending:
+    self.find_all()
+    made_cache = True
+  
+  # the misses are kept with the cache that they were looked up in, so that a
+  # scan in another thread can't be given misses from an older cache
+  now = time.time()
+  cache = self.__cache
+  for i in pending:
+   results[i] = self.__lookup(queries[i], cache)
+  pending = [i for i in pending if results[i] is None]
+  if not made_cache:
+   def missed_recently(query):
+    missed_at = cache.get("misses", {}).get(query, None)
+    return missed_at is not None and now - missed_at < self.miss_ttl
+   if [i for i in pending if isinstance(queries[i], basestring)
+                              and not missed_recently(queries[i])]:
+    self.find_all()
+    cache = self.__cache
+    for i in pending:
+     results[i] = self.__lookup(queries[i], cache)
+  
+  if self.miss_ttl and cache:
+   misses = cache["misses"]
+   for i in pending:
+    if results[i] is None and queries[i] not in misses:
+     misses[queries[i]] = now
+  return results
+ 
+ @staticmethod
+ def __lookup(item, cache):
+  if not cache:
+   return None
+  if isinstance(item, (int, long)):
+   try:
+    return cache["as_list"][item]
+   except IndexError:
+    return None
+  match = cache["by_bundle_id"].get(item, None)
+  if match:
+   return match
+  if isinstance(item, basestring):
+   item = item.upper()
+  return cache["by_uuid"].get(item, None)
+ 
+ def find_prefix(self, prefix, field="bundle_id"):
+  """Returns a list of the apps whose bundle ID or name starts with prefix.
+
+field is either "bundle_id" (the default) or "name".  Names are matched against
+the app's friendly name converted to lowercase and with its diacritical marks
+stripped (as in its sort_key; see sorted()), and the prefix is converted the
+same way, so a prefix of a friendly name matches regardless of case or accents.
+
+The apps are returned in order of the bundle ID, or of the sort_key for names.
+The cache is created if needed.  The prefix index for each field is a sorted
+list that is searched with bisect; it is built when it is first used and kept
+until the cache changes.
+
+"""
+  attr = self.__field_attr(field)
+  return self.__prefix_lookup(attr, self.__prefix_key(prefix, attr))
+ 
+ def match(self, pattern, field="bundle_id"):
+  """Returns a list of the apps whose bundle ID or name matches pattern.
+
+pattern is a shell-style wildcard pattern (see fnmatch), such as
+"com.example.*", that must match the whole bundle ID or name.  field and the
+order of the apps are the same as for find_prefix(), and the part of the
+pattern before the first wildcard is looked up with the prefix index.
+
+"""
+  attr = self.__field_attr(field)
+  pattern = self.__prefix_key(pattern, attr)
+  literal = pattern
+  for c in "*?[":
+   literal = literal.split(c, 1)[0]
+  return [app for app in self.__prefix_lookup(attr, literal)
+          if fnmatch.fnmatchcase(self.__prefix_key(app, attr), pattern)]
+ 
+ def where(self, *conditions):
+  """Returns a list of the apps that meet all of the given conditions.
+
+Each condition is either a string in the form accepted by parse_where() or a
+(key, op, value) tuple as returned by it.  key must be one of the keys from
+app_class.slot_names().  Values are compared as Unicode strings, with True
+and False as "true" and "false" and None as "".
+
+Conditions using "=" are looked up in a hash index, and conditions using "^="
+in a sorted index, for their key (each built when it is first used and kept
+until the cache changes).  Only the apps from the condition that narrows the
+list down the most are checked against the other conditions.  The apps are in
+the order of that index, or in cache order if no condition can use an index.
+The cache is created if needed.
+
+"""
+  conditions = [parse_where(c) if isinstance(c, basestring) else tuple(c)
+                for c in conditions]
+  valid_keys = self.app_class.slot_names()
+  for key, op, value in conditions:
+   if key not in valid_keys:
+    raise ValueError(repr(key) + " is not a valid key.")
+  if not self:
+   self.find_all()
+  cache = self.__cache
+  candidates = chosen = None
+  for condition in conditions:
+   key, op, value = condition
+   if op == "=":
+    apps = self.__hash_index(key, cache).get(value, [])
+   elif op == "^=":
+    apps = self.__prefix_lookup(key, value, cache)
+   else:
+    continue
+   if candidates is None or len(apps) < len(candidates):
+    candidates, chosen = apps, condition
+  if candidates is None:
+   candidates = cache["as_list"]
+  conditions = [condition for condition in conditions if condition is not chosen]
+  return [app for app in candidates
+          if all([_where_test(app, condition) for condition in conditions])]
+ 
+ @staticmethod
+ def __hash_index(attr, cache):
+  index = cache["hash_indexes"].get(attr, None)
+  if index is None:
+   index = {}
+   for app in cache["as_list"]:
+    index.setdefault(_where_text(getattr(app, attr)), []).append(app)
+   cache["hash_indexes"][attr] = index
+  return index
+ 
+ def __prefix_lookup(self, attr, prefix, cache=None):
+  keys, apps = self.__prefix_index(attr, cache)
+  start = bisect.bisect_left(keys, prefix)
+  end = start
+  while end < len(keys) and keys[end].startswith(prefix):
+   end += 1
+  if attr is None:
+   return sorted(apps[start:end], key=operator.attrgetter("sort_key"))
+  return apps[start:end]
+ 
+ def __prefix_index(self, attr, cache=None):
+  # attr is None for the index of names (see find_prefix()).  cache is the
+  # cache to use, which defaults to the current one (found first if needed).
+  if cache is None:
+   if not self:
+    self.find_all()
+   cache = self.__cache
+  index = cache["prefix_indexes"].get(attr, None)
+  if index is None:
+   apps = cache["as_list"]
+   if attr is None:
+    # the names are stripped of their diacritics all at once
+    keys = strip_latin_diacritics_many([
+     to_unicode(app.friendly or u"", errors="ignore").lower() for app in apps
+    ])
+   else:
+    keys = [self.__prefix_key(app, attr) for app in apps]
+   pairs = sorted(zip(keys, apps), key=operator.itemgetter(0))
+   index = cache["prefix_indexes"][attr] = ([k for k, app in pairs],
+                                            [app for k, app in pairs])
+  return index
+ 
+ @staticmethod
+ def __field_attr(field):
+  if field not in ("bundle_id", "name"):
+   raise ValueError(repr(field) + " is not a valid field.")
+  return None if field == "name" else field
+ 
+ @staticmethod
+ def __prefix_key(value, attr):
+  # Returns the key for an App or a query string in the prefix index for attr
+  if attr is None:
+   if isinstance(value, App):
+    value = value.friendly or u""
+   return strip_latin_diacritics(to_unicode(value, errors="ignore").lower())
+  if isinstance(value, App):
+   value = getattr(value, attr)
+  return _where_text(value)
+ 
  def find(self, query=None, mode=None, path=None, bundle_id=None, uuid=None):
   """Finds an App (or subclass) instance for the given path, bundle ID, or UUID.
 
 This method will use a cache to service the query, creating or re-creating
 the cache if necessary.  If the app cannot be found, even after (re-)creating
-the cache, the method will return None.
+the cache, the method will return None.  If the cache has not been created
+yet, then probe() is tried first for bundle IDs and UUIDs.
 
 mode can be one of "path", "bundle_id", or "uuid" and takes the place of the
 corresponding keyword arguments if set.  Extra arguments are passed to the
@@ -138,6 +604,10 @@ that bundle ID if so.)
   
   made_cache = False
   if not self:
+   if bundle_id or uuid:
+    match = self.probe(bundle_id=bundle_id, uuid=uuid)
+    if match:
+     return match
    self.find_all()
    made_cache = True
   
@@ -166,7 +636,126 @@ that bundle ID if so.)
   
   return match
  
- def find_all(self):
+ def probe(self, query=None, bundle_id=None, uuid=None):
+  """Finds one app by bundle ID or UUID without scanning the whole root.
+
+Returns an App (or subclass) instance, or None if the app could not be found
+this way (in which case a full scan might still find it).  The cache is
+neither used nor changed.  query is treated as a UUID if it looks like one,
+or as a bundle ID otherwise.
+
+For a UUID, only the container directory (or directories) with that name
+are loaded.  For a bundle ID, the bundle ID hints saved by the last full scan
+are used to find the app's containers, so this only works if a cache_dir was
+given to the constructor.  The hints are verified before they are used.  On
+iOS >= 8, if only one of the app's containers can be found this way, the other
+one is searched for in its container root, stopping at the first match, and
+the pair that was found is added to the hints (and saved with them if there is
+a cache_dir), so that the search is not repeated.
+
+"""
+  if len([i for i in (query, bundle_id, uuid) if i]) is not 1:
+   raise ValueError("Please specify only one of query, bundle_id, or uuid.")
+  if query:
+   if _UUID_RE.search(query):
+    uuid = query
+   else:
+    bundle_id = query
+  return self.__probe(bundle_id, uuid, self.__load_hints())
+ 
+ def __load_hints(self):
+  # The hints are read once and then kept up to date by __probe() and full
+  # scans
+  if self.__hints is None:
+   if self.cache_dir:
+    self.__hints = ScanCache(self.cache_dir, self.root.path).load_hints()
+   else:
+    self.__hints = {}
+  return self.__hints
+ 
+ def __save_hint(self, app):
+  # Remembers the containers of an app found by __probe()
+  pair = (app.bundle_uuid, app.data_uuid)
+  hints = self.__load_hints()
+  if hints.get(app.bundle_id, None) != pair:
+   hints[app.bundle_id] = pair
+   if self.cache_dir:
+    ScanCache(self.cache_dir, self.root.path).save_hints(hints)
+ 
+ def __probe(self, bundle_id, uuid, hints, search_roots=True):
+  # search_roots=False only uses the containers that uuid and the hints point
+  # to, and never searches a container root for the other one
+  root = self.root
+  
+  def container_at(class_root, name):
+   if name:
+    path = os.path.join(class_root, name)
+    if fs.isdir(path):
+     return self.__make_container(path)
+   return None
+  
+  def search(class_root, class_):
+   for entry in fs.scandir(class_root):
+    if entry.is_dir():
+     container = self.__make_container(entry.path)
+     if container and container.class_ is class_ and container.bundle_id == bundle_id:
+      return container
+   return None
+  
+  def make_app(bundle_container, data_container):
+   try:
+    return self.app_class(bundle_container, data_container,
+                          *self.app_args, **self.app_kwargs)
+   except AppError:
+    return None
+  
+  if uuid:
+   uuid = uuid.upper()
+  
+  if root.min_ios < 8:
+   container = container_at(root.legacy_root, uuid or hints.get(bundle_id, (None,))[0])
+   if container and container.bundle_id and bundle_id in (None, container.bundle_id):
+    return make_app(container, container)
+   return None
+  
+  bundle_container = data_container = None
+  if uuid:
+   bundle_container = container_at(root.bundle_root, uuid)
+   if bundle_container is None:
+    data_container = container_at(root.data_root, uuid)
+   container = bundle_container or data_container
+   if container is None or not container.bundle_id:
+    return None
+   bundle_id = container.bundle_id
+  bundle_uuid, data_uuid = hints.get(bundle_id, (None, None))
+  if bundle_container is None:
+   bundle_container = container_at(root.bundle_root, bundle_uuid)
+  if data_container is None:
+   data_container = container_at(root.data_root, data_uuid)
+  if bundle_container is not None:
+   if (bundle_container.class_ is not ContainerClass.BUNDLE or
+       bundle_container.bundle_id != bundle_id):
+    bundle_container = None
+  if data_container is not None:
+   if (data_container.class_ is not ContainerClass.DATA or
+       data_container.bundle_id != bundle_id):
+    data_container = None
+  if bundle_container is None and data_container is None:
+   return None
+  if not search_roots and (bundle_container is None or data_container is None):
+   return None
+  if bundle_container is None:
+   bundle_container = search(root.bundle_root, ContainerClass.BUNDLE)
+  if data_container is None:
+   data_container = search(root.data_root, ContainerClass.DATA)
+  if bundle_container is None or data_container is None:
+   return None
+  app = make_app(bundle_container, data_container)
+  if app is not None:
+   self.__save_hint(app)
+  return app
+ 
+ def find_all(self, workers=None, processes=None):
   """Finds all App Store apps.
 
 Returns self.
@@ -175,43 +764,271 @@ This also creates (or re-creates) a memory-backed cache of all apps in
 the given root, and this cache is used to service searches for individual
 apps.
 
+workers is the number of threads to use to construct Container and App objects
+concurrently, which helps when the root is on slow (e.g. network) storage.  It
+defaults to the workers value given to the constructor.  The resulting cache is
+the same, and in the same order, regardless of the number of workers.
+
+processes is the number of worker processes to use to decode container
+metadata and Info.plist files, which helps when the scan is limited by plist
+parsing rather than by I/O.  It defaults to the processes value given to the
+constructor.  The workers only send back the plist keys that Container and
+app_class use (CONTAINER_METADATA_KEYS and app_class.info_plist_keys).
+
+After the scan, the scan_syscalls attribute is set to a dictionary that maps
+the kinds of file system calls made during the scan ("scandir", "stat", and
+"open") to how many of each were made (see util.fs).  If other scans are
+running at the same time in other threads, their calls are counted too.
+
+Scans of the same AppList from different threads (including by refresh() and
+iter_apps()) are run one at a time.  Lookups in other threads are not blocked
+by a scan, and keep using the previous cache until the scan is finished.
+
 """
+  return self.__scan(workers, processes)
+ 
+ def refresh(self, workers=None, processes=None):
+  """Incrementally updates the cache to reflect changes since the last refresh.
+
+Returns self.
+
+The container directories in the root are compared with the ones seen by the
+last refresh, and Container and App objects are only made for directories
+that were added or whose metadata has changed (i.e. whose directory entry or
+metadata plist has a different inode, size, or mtime).  Apps whose containers
+were removed are dropped from the cache, and all other apps are kept as-is.
+
+If the cache has not been created yet, or was last created by find_all(), then
+this does a full scan like find_all(), and later calls will be incremental.
+
+workers and processes have the same meaning as for find_all().
+
+"""
+  return self.__scan(workers, processes, incremental=True)
+ 
+ def iter_apps(self, workers=None):
+  """Finds all App Store apps, yielding each one as soon as it is loaded.
+
+This is a generator that yields each App (or subclass) instance as soon as both
+of its containers have been found and it has been initialized, in no particular
+order.  To find pairs of containers early, bundle and data containers are
+scanned alternately.  workers has the same meaning as for find_all().
+
+When the generator is exhausted, the cache is filled as if find_all() had been
+called, reusing the apps that were yielded.  If the generator is closed early,
+the cache is left as it was.
+
+"""
+  if workers is None:
+   workers = self.workers
+  root = self.root
+  known_containers = {}
+  known_apps = {}
+  if root.min_ios >= 8:
+   bundle_dirs = [entry.path for entry in fs.scandir(root.bundle_root)
+                  if entry.is_dir()]
+   data_dirs   = [entry.path for entry in fs.scandir(root.data_root)
+                  if entry.is_dir()]
+   container_dirs = []
+   for i in xrange(max(len(bundle_dirs), len(data_dirs))):
+    container_dirs += bundle_dirs[i:i + 1] + data_dirs[i:i + 1]
+   # each container's metadata plist, plus each app's Info.plist
+   propertylist.parse_cache.reserve(len(container_dirs) + len(bundle_dirs))
+   pending = {}
+   results = _imap(self.__make_container, container_dirs, workers)
+   for container_dir, container in itertools.izip(container_dirs, results):
+    known_containers[container_dir] = container
+    if not container or not container.bundle_id:
+     continue
+    class_name = container.class_.name.lower()
+    if class_name not in ("bundle", "data"):
+     continue
+    pair = pending.setdefault(container.bundle_id, {})
+    pair[class_name] = container
+    if len(pair) == 2 and container.bundle_id not in known_apps:
+     try:
+      app = self.app_class(pair["bundle"], pair["data"],
+                           *self.app_args, **self.app_kwargs)
+     except AppError:
+      continue
+     known_apps[container.bundle_id] = app
+     yield app
+  else:  # root.min_ios < 8
+   container_dirs = [entry.path for entry in fs.scandir(root.legacy_root)
+                     if entry.is_dir()]
+   propertylist.parse_cache.reserve(len(container_dirs))
+   with propertylist.parse_cache.wanting(self.app_class.info_plist_keys):
+    results = _imap(self.__make_container, container_dirs, workers)
+    for container_dir, container in itertools.izip(container_dirs, results):
+     known_containers[container_dir] = container
+     if container and container.bundle_id:
+      try:
+       app = self.app_class(container, container,
+                            *self.app_args, **self.app_kwargs)
+      except AppError:
+       continue
+      known_apps[container.bundle_id] = app
+      yield app
+  self.__scan(workers, known=(known_containers, known_apps))
+ 
+ def __scan(self, *args, **kwargs):
+  with self.__scan_lock:
+   return self.__scan_unlocked(*args, **kwargs)
+ 
+ def __scan_unlocked(self, workers=None, processes=None, incremental=False,
+                     known=None):
+  # known, if given, is a tuple of a dictionary mapping container directories
+  # to Container objects (or None) and a dictionary mapping bundle IDs to App
+  # objects that were already made (e.g. by iter_apps()), which are used
+  # instead of making new ones where possible.
+  if workers is None:
+   workers = self.workers
+  if processes is None:
+   processes = self.processes
+  info_plist_keys = tuple(self.app_class.info_plist_keys)
+  use_processes = bool(processes and processes > 1)
+  cache = None
+  if self.cache_dir and not known:
+   cache = ScanCache(self.cache_dir, self.root.path)
+  use_preload = use_processes or cache is not None
+  syscalls_before = fs.syscalls.snapshot()
+  
+  # by_path maps each container directory to its signature and Container
+  # object, and is only kept once refresh() has been used
+  old_by_path = known_apps = {}
+  tracked = self.__cache.get("by_path", None) is not None
+  # the containers from the last scan, whose app bundles are used for their
+  # signatures even if they are not reused
+  last_by_path = self.__cache.get("by_path", None) or {}
+  if incremental and tracked:
+   old_by_path = self.__cache["by_path"]
+   known_apps  = self.__cache["by_bundle_id"]
+  by_path = None
+  if incremental or tracked:
+   by_path = {}
+  known_containers = {}
+  if known:
+   known_containers = known[0]
+   known_apps = dict(known_apps)
+   known_apps.update(known[1])
+  containers = {}
+  
+  def make_legacy_app(container):
+   try:
+    return self.app_class(container, container,
+                          *self.app_args, **self.app_kwargs)
+   except AppError:
+    return None
+  
+  def init_app(app):
+   try:
+    if None in (app.containers.bundle, app.containers.data):
+     raise AppError()
+    app.__init__(app.containers.bundle, app.containers.data,
+                 *self.app_args, **self.app_kwargs)
+    return True
+   except AppError:
+    return False
+  
+  def old_app(bundle_id, bundle_container, data_container):
+   # Returns an already-made app if it has the same containers
+   app = known_apps.get(bundle_id, None)
+   if app is not None and app.containers.bundle is bundle_container \
+                      and app.containers.data   is data_container:
+    return app
+   return None
+  
+  def changed_dirs(container_dirs):
+   # Returns the directories that need new Container objects, and puts the
+   # known or (for unchanged directories) old containers in containers and
+   # the directories' signatures in by_path
+   r = []
+   signatures = [None] * len(container_dirs)
+   if by_path is not None:
+    def signature(container_dir):
+     container = known_containers.get(container_dir, None)
+     if container is None:
+      container = last_by_path.get(container_dir, (None, None))[1]
+     return _container_signature(container_dir, container)
+    signatures = _map(signature, container_dirs, workers)
+   for container_dir, signature in zip(container_dirs, signatures):
+    old = old_by_path.get(container_dir, None)
+    if container_dir in known_containers:
+     containers[container_dir] = known_containers[container_dir]
+    elif old is not None and old[0] == signature:
+     containers[container_dir] = old[1]
+    else:
+     r += [container_dir]
+    if by_path is not None:
+     by_path[container_dir] = (signature, containers.get(container_dir, None))
+   return r
+  
+  def record(container_dirs, new_containers):
+   # Stores the new containers in containers and by_path and returns containers
+   for container_dir, container in zip(container_dirs, new_containers):
+    containers[container_dir] = container
+    if by_path is not None:
+     signature = by_path[container_dir][0]
+     signature = signature[:2] + (_info_signature(container),)
+     by_path[container_dir] = (signature, container)
+   return containers
+  
   index_by_bundle_id = {}
   index_by_uuid      = {}
   apps               = []
   root = self.root
   if root.min_ios >= 8:
    search_roots = (root.bundle_root, root.data_root)
-   for type_root in search_roots:
-    for container_dir_base in os.listdir(type_root):
-     app = None
-     try:
-      container = Container(os.path.join(type_root, container_dir_base))
-      if container.bundle_id:
-       class_name = container.class_.name.lower()
-       app = index_by_bundle_id.get(container.bundle_id, None)
-       if app == None:
-        if class_name == "bundle":
-         app = self.app_class.__new__(self.app_class, None, None,
-                                      *self.app_args, **self.app_kwargs)
-	 app.bundle_id = container.bundle_id
-         index_by_bundle_id[container.bundle_id] = app
-	 apps += [app]
-        else:
-         continue  # data containers can also be for built-in apps
-       if class_name in ("bundle", "data"):
-        setattr(app.containers, class_name, container)
-        if container.uuid:
-         index_by_uuid[container.uuid.upper()] = app
-     except ContainerError:
-      pass
-   for app in apps:
-    try:
-     if None in (app.containers.bundle, app.containers.data):
-      raise AppError()
-     app = app.__init__(app.containers.bundle, app.containers.data,
-                        *self.app_args, **self.app_kwargs)
-    except AppError:
+   container_dirs = [entry.path for type_root in search_roots
+                     for entry in fs.scandir(type_root) if entry.is_dir()]
+   new_dirs = changed_dirs(container_dirs)
+   # each container's metadata plist, plus (at most) each app's Info.plist
+   propertylist.parse_cache.reserve(2 * len(container_dirs))
+   metadata = {}
+   if use_preload:
+    metadata = _preload([os.path.join(to_unicode(os.path.abspath(container_dir)),
+                                      CONTAINER_METADATA_PLIST)
+                         for container_dir in new_dirs],
+                        CONTAINER_METADATA_KEYS, processes, cache)
+   with propertylist.preloaded(metadata):
+    containers = record(new_dirs, _map(self.__make_container, new_dirs, workers))
+   for container_dir in container_dirs:
+    container = containers[container_dir]
+    if container and container.bundle_id:
+     class_name = container.class_.name.lower()
+     app = index_by_bundle_id.get(container.bundle_id, None)
+     if app == None:
+      if class_name == "bundle":
+       app = self.app_class.__new__(self.app_class, None, None,
+                                    *self.app_args, **self.app_kwargs)
+       app.bundle_id = container.bundle_id
+       index_by_bundle_id[container.bundle_id] = app
+       apps += [app]
+      else:
+       continue  # data containers can also be for built-in apps
+     if class_name in ("bundle", "data"):
+      setattr(app.containers, class_name, container)
+      if container.uuid:
+       index_by_uuid[container.uuid.upper()] = app
+   if known_apps:
+    # replace the new apps with the old ones if their containers are the same
+    for i, app in enumerate(apps):
+     old = old_app(app.bundle_id, app.containers.bundle, app.containers.data)
+     if old is not None:
+      apps[i] = index_by_bundle_id[app.bundle_id] = old
+      for container in (old.containers.bundle, old.containers.data):
+       if container.uuid and index_by_uuid.get(container.uuid.upper()) is app:
+        index_by_uuid[container.uuid.upper()] = old
+   new_apps = [app for app in apps if not app]
+   info = {}
+   if use_preload and self.app_class.needs(self.fields, self.lazy)[1]:
+    info = _preload([app.containers.bundle.find_app_bundle()[1]
+                     for app in new_apps if app.containers.bundle],
+                    info_plist_keys, processes, cache)
+   with propertylist.preloaded(info):
+    results = _map(init_app, new_apps, workers)
+   for app, ok in zip(new_apps, results):
+    if not ok:
      index_by_bundle_id.pop(app.bundle_id, None)
      bundle_uuid = getattr(app.containers.bundle, "uuid", "").upper()
      data_uuid   = getattr(app.containers.data,   "uuid", "").upper()
@@ -219,45 +1036,216 @@ apps.
       index_by_uuid.pop(bundle_uuid, None)
      if data_uuid and data_uuid != bundle_uuid:
       index_by_uuid.pop(data_uuid, None)
-     continue
    apps = [app for app in apps if app]
   else:  # root.min_ios < 8
-   for container_dir_base in os.listdir(root.legacy_root):
-    try:
-     container = Container(os.path.join(root.legacy_root, container_dir_base))
-     if container.bundle_id:
-      try:
-       app = self.app_class(container, container,
-                            *self.app_args, **self.app_kwargs)
-       index_by_bundle_id[container.bundle_id] = app
-       if container.uuid:
-        index_by_uuid[container.uuid.upper()] = app
-       apps += [app]
-      except AppError:
-       pass
-    except ContainerError:
-     pass
+   container_dirs = [entry.path for entry in fs.scandir(root.legacy_root)
+                     if entry.is_dir()]
+   new_dirs = changed_dirs(container_dirs)
+   propertylist.parse_cache.reserve(len(container_dirs))
+   # Container and app_class read the same Info.plist files, so have the
+   # parse cache keep app_class's keys when Container reads them
+   with propertylist.parse_cache.wanting(info_plist_keys):
+    info = {}
+    if use_preload:
+     info = _preload(_map(_info_plist, new_dirs, workers),
+                     ("CFBundleIdentifier",) + info_plist_keys, processes, cache)
+    with propertylist.preloaded(info):
+     containers = record(new_dirs, _map(self.__make_container, new_dirs, workers))
+     containers = [containers[container_dir] for container_dir in container_dirs]
+     containers = [container for container in containers
+                   if container and container.bundle_id]
+     legacy_apps = [old_app(container.bundle_id, container, container)
+                    for container in containers]
+     new_containers = [container for container, app in zip(containers, legacy_apps)
+                       if app is None]
+     new_apps = iter(_map(make_legacy_app, new_containers, workers))
+     legacy_apps = [app if app is not None else new_apps.next()
+                    for app in legacy_apps]
+   for container, app in zip(containers, legacy_apps):
+    if app:
+     index_by_bundle_id[container.bundle_id] = app
+     if container.uuid:
+      index_by_uuid[container.uuid.upper()] = app
+     apps += [app]
+  
+  if cache:
+   cache.save()
+  if self.cache_dir:
+   hints = dict([(app.bundle_id, (app.bundle_uuid, app.data_uuid)) for app in apps])
+   (cache or ScanCache(self.cache_dir, root.path)).save_hints(hints)
+   self.__hints = hints
   
   self.__cache = {
    "by_bundle_id": index_by_bundle_id,
    "by_uuid":      index_by_uuid,
-   "as_list":      apps
+   "by_path":      by_path,
+   "as_list":      apps,
+   # lookups that are kept until the cache changes; they are part of the
+   # cache so that they are replaced with it in one assignment, and results
+   # from an old cache can't be stored with a new one
+   "misses":         {},
+   "sorted_views":   {},
+   "prefix_indexes": {},
+   "hash_indexes":   {}
   }
+  self.scan_syscalls = fs.syscalls.since(syscalls_before)
   
   return self
  
- def sorted(self, key="sort_key"):
+ def watch(self, interval=None, callback=None, poll=False):
+  """Keeps the cache up to date as apps are installed, removed, or changed.
+
+This is a generator that yields an AppListEvent for each change, in the order
+of the cache, after the cache has been updated with refresh().  If callback is
+given, it is also called with each event before the event is yielded.  Nothing
+is watched unless the generator is being iterated, and closing the generator
+stops watching.
+
+On Linux, inotify is used to watch the bundle and data (or legacy) container
+directories, each container in them, and each app bundle in those, and
+refresh() is only called after something changes there.  Otherwise, or if poll is True, refresh() is called
+every interval seconds (default 2).  With inotify, interval (default None)
+is the longest time to wait before calling refresh() anyway.
+
+If the cache was not made by refresh(), then refresh() is called before
+watching starts, and the apps found then are not reported as events.
+
+"""
+  watcher = None
+  if not poll and inotify.available():
+   try:
+    watcher = inotify.Inotify()
+   except inotify.InotifyError:
+    pass
+  if interval is None and (watcher is None):
+   interval = 2
+  try:
+   if self.__cache.get("by_path", None) is None:
+    self.refresh()
+   root = self.root
+   roots = [path for path in (root.bundle_root, root.data_root, root.legacy_root)
+            if path]
+   watched = {}
+   while True:
+    if watcher is not None:
+     by_path = self.__cache["by_path"]
+     container_dirs = set(by_path)
+     try:
+      for path in set(watched) - container_dirs:
+       for watched_path in watched[path]:
+        watcher.forget(watched_path)
+       del watched[path]
+      for path in roots:
+       watcher.add(path)
+      for path in container_dirs - set(watched):
+       # Watch the app bundle too, so that changes to its Info.plist are seen
+       watched[path] = [path]
+       container = by_path[path][1]
+       if container is not None and container.class_ in (ContainerClass.BUNDLE,
+                                                         ContainerClass.LEGACY):
+        name = container.find_app_bundle()[0]
+        if name:
+         watched[path] += [os.path.join(path, name)]
+       for watched_path in watched[path]:
+        watcher.add(watched_path)
+     except inotify.InotifyError:
+      # e.g. when there are too many watches; fall back to polling
+      watcher.close()
+      watcher = None
+      interval = interval or 2
+      continue
+     watcher.wait(interval)
+    else:
+     time.sleep(interval)
+    old_cache = self.__cache
+    self.refresh()
+    for event in self.__changes(old_cache, self.__cache):
+     if callback:
+      callback(event)
+     yield event
+  finally:
+   if watcher is not None:
+    watcher.close()
+ 
+ @staticmethod
+ def __changes(old_cache, new_cache):
+  # Yields AppListEvents for the differences between two caches
+  old = old_cache.get("by_bundle_id", {})
+  new = new_cache.get("by_bundle_id", {})
+  for app in old_cache.get("as_list", []):
+   if app.bundle_id not in new:
+    yield AppListEvent("removed", app.bundle_id, app)
+  for app in new_cache.get("as_list", []):
+   old_app = old.get(app.bundle_id, None)
+   if old_app is None:
+    yield AppListEvent("added", app.bundle_id, app)
+   elif old_app is not app:
+    yield AppListEvent("changed", app.bundle_id, app)
+ 
+ def sorted(self, key="sort_key", limit=None, offset=0):
   """Returns an iterator that yields each app in the cache sorted according to key.
 
 key is either a string that tells which App attribute should be used as a sort
 key, or a callable that is passed an App and returns a sort key.  The default is
 "sort_key" (the app's friendly name, converted to lowercase, with diacritical
 marks stripped using util.strip_latin_diacritics(), an underscore, and then the
-app's bundle ID).
+app's bundle ID).  If key is a string in self.sort_keys, which maps names to
+callables, then that callable is used instead of an attribute.
+
+If limit is given, then at most limit apps are returned, starting offset apps
+into the sorted list.  Otherwise, all apps after the first offset are returned.
+
+The sorted list for each string key is kept until the cache changes, so sorting
+again by the same key is cheap.  When a limit is given and the key has not been
+sorted by yet, only the first offset + limit apps are selected (with
+heapq.nsmallest()) instead of sorting the whole list.  Sorts by callables that
+are not in self.sort_keys are not kept.
 
 """
-  l = self.__cache["as_list"] if self else []
+  cache = self.__cache
+  l = cache["as_list"] if cache else []
+  views = cache["sorted_views"] if cache else {}
+  end = None if limit is None else offset + max(limit, 0)
   if callable(key):
-   return sorted(l, key=key)
+   name, func = None, key
   else:
-   return sorted(l, key=lambda app: getattr(app, key))
+   name, func = key, self.sort_keys.get(key, None) or operator.attrgetter(key)
+  view = views.get(name, None) if name is not None else None
+  if view is None:
+   if end is not None and end < len(l):
+    return heapq.nsmallest(end, l, key=func)[offset:]
+   view = sorted(l, key=func)
+   if name is not None:
+    views[name] = view
+  return view[offset:end]
+ 
+ def iter_rows(self, fields=None, apps=None, dicts=False):
+  """Yields a tuple of the values of the given attributes for each app.
+
+fields defaults to self.app_class.field_plan(), in which case the rows are the
+same as from App.to_row() (or App.to_dict()).  apps is an iterable of the apps
+to use (e.g. from sorted() or where()) and defaults to the apps in the cache
+(which are found first if the cache is empty).  If dicts is True, then
+dictionaries like the ones from App.to_dict() are yielded instead of tuples.
+
+The attributes are read with one getter that is made once per set of fields, so
+this is faster than calling dict() on each app.
+
+"""
+  if apps is None:
+   if not self:
+    self.find_all()
+   apps = self.__cache["as_list"]
+  if fields is None:
+   for app in apps:
+    yield app.to_dict() if dicts else app.to_row()
+   raise StopIteration
+  fields = tuple(fields)
+  getter = _row_getter(fields)
+  if dicts:
+   for app in apps:
+    yield dict(zip(fields, getter(app)))
+  else:
+   for app in apps:
+    yield getter(app)
+  raise StopIteration
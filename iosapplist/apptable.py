@@ -0,0 +1,424 @@
+# iosapplist
+# A Python package that lists iOS App Store apps.  (Formerly part of AppBackup.)
+#
+# Copyright (C) 2008-2014 Scott Zeid
+# https://s.zeid.me/projects/appbackup/
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# 
+# Except as contained in this notice, the name(s) of the above copyright holders
+# shall not be used in advertising or otherwise to promote the sale, use or
+# other dealings in this Software without prior written authorization.
+
+# AppTable class
+
+from __future__ import with_statement
+
+import os
+
+from array import array
+
+try:
+ import numpy
+except ImportError:
+ numpy = None
+
+from app import App
+from applist import parse_where, _where_test_value
+from util import *
+
+__all__ = ["AppTable", "AppRow"]
+
+
+class AppTable(object):
+ """A compact, column-oriented table of apps, for very large app lists.
+
+Apps from one or more AppLists (or other iterables of App objects or of
+dictionaries like the ones from dict(app), such as robot output) can be added
+to the table.  Only their attributes are kept, not the App and Container
+objects.  Each string is stored once in a string table, and each row is a set
+of integer indexes into it in array columns.  Paths are stored as a parent
+directory and a base name, so the paths of apps from the same root share most
+of their storage.
+
+The table supports the same lookups as AppList (find(), get(), self[query],
+sorted(), where(), len(), and iteration).  Those return AppRow objects,
+which are views of a single row that act like read-only App objects, and are
+only made when they are asked for.  Sorting, filtering, and counting work on
+the columns without making an AppRow for each app, using NumPy if it is
+installed.
+
+Unlike AppList, a table can have more than one app with the same bundle ID
+or UUID (e.g. from different devices).  find(), get(), and self[query] give
+the first one that was added.
+
+"""
+
+ columns = ("bundle_id", "name", "friendly", "sort_key", "bundle_path",
+            "bundle_uuid", "data_path", "data_uuid", "useable")
+ path_columns = ("bundle_path", "data_path")
+
+ def __init__(self, apps=None):
+  """Makes a table, adding the given apps if any (see extend())."""
+  self.__strings    = []
+  self.__string_ids = {}
+  self.__columns = {}
+  for column in self.columns:
+   if column == "useable":
+    self.__columns[column] = array("b")
+   elif column in self.path_columns:
+    self.__columns[column] = (array("l"), array("l"))
+   else:
+    self.__columns[column] = array("l")
+  self.__by_bundle_id = {}
+  self.__by_uuid      = {}
+  self.__sort_ranks   = {}
+  if apps is not None:
+   self.extend(apps)
+
+ def __len__(self):
+  return len(self.__columns["useable"])
+
+ def __nonzero__(self):
+  return bool(len(self))
+
+ def __iter__(self):
+  for i in xrange(len(self)):
+   yield AppRow(self, i)
+
+ def __contains__(self, item):
+  try:
+   self.__getitem__(item)
+   return True
+  except KeyError:
+   pass
+  return False
+
+ def __getitem__(self, item):
+  if isinstance(item, (int, long)):
+   if item < 0:
+    item += len(self)
+   if not 0 <= item < len(self):
+    raise IndexError("row index out of range")
+   return AppRow(self, item)
+  match = self.find(item)
+  if match is None:
+   raise KeyError(repr(item))
+  return match
+
+ def get(self, key, default=None):
+  try:
+   return self[key]
+  except KeyError:
+   return default
+
+ def add(self, app):
+  """Adds one app, which can be an App object or a dictionary like dict(app).
+
+Returns the new row's index.
+
+"""
+  i = len(self)
+  get = app.get if isinstance(app, dict) else lambda key, default: getattr(app, key, default)
+  for column in self.columns:
+   value = get(column, None)
+   if column == "useable":
+    self.__columns[column].append(-1 if value is None else int(bool(value)))
+   elif column in self.path_columns:
+    dirs, bases = self.__columns[column]
+    if value is None:
+     dirs.append(-1)
+     bases.append(-1)
+    else:
+     parent, base = os.path.split(to_unicode(value, errors="ignore"))
+     dirs.append(self.__intern(parent))
+     bases.append(self.__intern(base))
+   else:
+    self.__columns[column].append(self.__intern(value))
+  bundle_id = self.__columns["bundle_id"][i]
+  if bundle_id != -1:
+   self.__by_bundle_id.setdefault(bundle_id, i)
+  for column in ("bundle_uuid", "data_uuid"):
+   uuid = self.__strings[self.__columns[column][i]] if self.__columns[column][i] != -1 else None
+   if uuid:
+    self.__by_uuid.setdefault(uuid.upper(), i)
+  self.__sort_ranks = {}
+  return i
+
+ def extend(self, apps):
+  """Adds each app in apps (see add())."""
+  for app in apps:
+   self.add(app)
+
+ def find(self, query=None, mode=None, path=None, bundle_id=None, uuid=None):
+  """Returns the first AppRow for the given path, bundle ID, or UUID, or None.
+
+The arguments are the same as for AppList.find(), except that query without a
+mode can be either a bundle ID or a UUID (like self[query]), and that path
+must be the path of one of the app's containers.
+
+"""
+  if len([i for i in (path, bundle_id, uuid, mode) if i]) > 1:
+   raise ValueError("Please specify only one of path, bundle_id, uuid, or mode.")
+  if mode not in ("path", "bundle_id", "uuid", None):
+   raise ValueError(repr(mode) + " is not a valid mode.")
+  if   mode == "path":      path      = query
+  elif mode == "bundle_id": bundle_id = query
+  elif mode == "uuid":      uuid      = query
+  elif query:
+   bundle_id = uuid = query
+  i = None
+  if bundle_id:
+   i = self.__by_bundle_id.get(self.__string_ids.get(to_unicode(bundle_id,
+                                                                errors="ignore")))
+  if i is None and uuid:
+   i = self.__by_uuid.get(to_unicode(uuid, errors="ignore").upper())
+  if i is None and path:
+   path = to_unicode(os.path.abspath(path), errors="ignore")
+   for column in self.path_columns:
+    rows = self.__rows_equal(column, path)
+    if rows:
+     i = rows[0]
+     break
+  return AppRow(self, i) if i is not None else None
+
+ def sorted(self, key="sort_key", limit=None, offset=0):
+  """Returns a list of AppRows sorted according to key.
+
+key, limit, and offset are the same as for AppList.sorted(), except that string
+keys must be in self.columns.  Sorts by a column use the column's sort ranks
+(the position of each of its strings in sorted order), which are kept until the
+table changes, so the rows themselves are never compared.  Ties keep the order
+that the rows were added in.
+
+"""
+  end = None if limit is None else offset + max(limit, 0)
+  if callable(key):
+   rows = sorted(self, key=key)
+   return rows[offset:end]
+  if key not in self.columns:
+   raise ValueError(repr(key) + " is not a valid column.")
+  ranks = self.__ranks(key)
+  if numpy is not None:
+   order = numpy.argsort(numpy.array(ranks), kind="mergesort").tolist()
+  else:
+   order = sorted(xrange(len(ranks)), key=ranks.__getitem__)
+  return [AppRow(self, i) for i in order[offset:end]]
+
+ def where(self, *conditions):
+  """Returns a list of the AppRows that meet all of the given conditions.
+
+The conditions are the same as for AppList.where(), except that keys must be in
+self.columns.  Each condition is evaluated once per distinct string in its
+column rather than once per row.  The rows are in the order they were added.
+
+"""
+  return [AppRow(self, i) for i in self.__where(conditions)]
+
+ def count(self, *conditions):
+  """Returns the number of apps that meet all of the given conditions (see
+where()), or the number of apps if no conditions are given."""
+  if not conditions:
+   return len(self)
+  return len(self.__where(conditions))
+
+ def value(self, column, i):
+  """Returns the value of the given column for row i."""
+  col = self.__columns[column]
+  if column == "useable":
+   return None if col[i] == -1 else bool(col[i])
+  if column in self.path_columns:
+   if col[0][i] == -1:
+    return None
+   return os.path.join(self.__strings[col[0][i]], self.__strings[col[1][i]])
+  return self.__strings[col[i]] if col[i] != -1 else None
+
+ def __intern(self, value):
+  if value is None:
+   return -1
+  value = to_unicode(value, errors="ignore")
+  i = self.__string_ids.get(value, None)
+  if i is None:
+   i = self.__string_ids[value] = len(self.__strings)
+   self.__strings.append(value)
+  return i
+
+ def __ranks(self, column):
+  # Returns a list with the sort rank of each row's value in column
+  ranks = self.__sort_ranks.get(column, None)
+  if ranks is None:
+   col = self.__columns[column]
+   if column == "useable":
+    ranks = col.tolist()
+   elif column in self.path_columns:
+    values = sorted(set(zip(col[0], col[1])),
+                    key=lambda pair: self.__pair_text(pair))
+    rank = dict([(pair, n) for n, pair in enumerate(values)])
+    ranks = [rank[pair] for pair in zip(col[0], col[1])]
+   else:
+    ids = sorted(set(col), key=lambda i: self.__strings[i] if i != -1 else None)
+    rank = dict([(i, n) for n, i in enumerate(ids)])
+    ranks = [rank[i] for i in col]
+   self.__sort_ranks[column] = ranks
+  return ranks
+
+ def __pair_text(self, pair):
+  if pair[0] == -1:
+   return None
+  return os.path.join(self.__strings[pair[0]], self.__strings[pair[1]])
+
+ def __rows_equal(self, column, value):
+  # Returns the indexes of the rows whose value in column equals value
+  col = self.__columns[column]
+  if column == "useable":
+   return [i for i in self.__where([(column, "=", value)])]
+  if column in self.path_columns:
+   parent, base = os.path.split(value)
+   parent, base = self.__string_ids.get(parent), self.__string_ids.get(base)
+   if parent is None or base is None:
+    return []
+   return [i for i in self.__rows_with(col[0], parent) if col[1][i] == base]
+  sid = self.__string_ids.get(value, None)
+  if sid is None:
+   return []
+  return self.__rows_with(col, sid)
+
+ @staticmethod
+ def __rows_with(col, sid):
+  if numpy is not None:
+   return numpy.flatnonzero(numpy.frombuffer(col, dtype=col.typecode) == sid).tolist()
+  return [i for i, v in enumerate(col) if v == sid]
+
+ def __where(self, conditions):
+  # Returns the indexes of the rows that meet all of the conditions
+  conditions = [parse_where(c) if isinstance(c, basestring) else tuple(c)
+                for c in conditions]
+  for key, op, value in conditions:
+   if key not in self.columns:
+    raise ValueError(repr(key) + " is not a valid key.")
+  rows = None
+  for key, op, value in conditions:
+   # an empty value also matches None (as in AppList.where()), which is not
+   # in the string table, so those conditions are tested row by row
+   if op == "=" and key != "useable" and value:
+    rows = self.__rows_equal(key, value)
+    conditions.remove((key, op, value))
+    break
+  if rows is None:
+   rows = xrange(len(self))
+  for key, op, value in conditions:
+   col = self.__columns[key]
+   results = {}
+   if key in self.path_columns:
+    ids = lambda i: (col[0][i], col[1][i])
+    decode = self.__pair_text
+   elif key == "useable":
+    ids = col.__getitem__
+    decode = lambda v: None if v == -1 else bool(v)
+   else:
+    ids = col.__getitem__
+    decode = lambda v: self.__strings[v] if v != -1 else None
+   def test(i):
+    v = ids(i)
+    r = results.get(v, None)
+    if r is None:
+     r = results[v] = _where_test_value(decode(v), op, value)
+    return r
+   rows = [i for i in rows if test(i)]
+  return list(rows)
+
+
+class AppRow(object):
+ """A read-only, App-like view of one row in an AppTable.
+
+The same attributes as App (other than containers) can be read in attribute or
+dictionary style, and info_str() works the same way.
+
+"""
+ __slots__ = ["table", "index"]
+
+ info_tpl = App.info_tpl
+
+ def __init__(self, table, index):
+  self.table = table
+  self.index = index
+
+ def __getattr__(self, attr):
+  if attr in AppTable.columns:
+   return self.table.value(attr, self.index)
+  raise AttributeError(attr)
+
+ def __eq__(self, other):
+  return (isinstance(other, AppRow) and self.table is other.table and
+          self.index == other.index)
+
+ def __ne__(self, other):
+  return not self == other
+
+ def __hash__(self):
+  return hash((id(self.table), self.index))
+
+ def __repr__(self):
+  return "<%s %d: %s>" % (type(self).__name__, self.index, repr(self.bundle_id))
+
+ @classmethod
+ def field_plan(cls):
+  return AppTable.columns
+
+ @classmethod
+ def slot_names(cls):
+  return App.slot_names()
+
+ info_str = App.__dict__["info_str"]
+
+ def to_dict(self, fields=None):
+  return dict(zip(fields or self.field_plan(), self.to_row(fields)))
+
+ def to_row(self, fields=None):
+  table, index = self.table, self.index
+  return tuple([table.value(column, index) for column in fields or self.field_plan()])
+
+ # Dict-alike methods
+
+ def __contains__(self, key):
+  return key in AppTable.columns
+
+ def __getitem__(self, key):
+  if key not in AppTable.columns:
+   raise KeyError(key)
+  return self.table.value(key, self.index)
+
+ def items(self):
+  return list(self.iteritems())
+
+ def iteritems(self):
+  return iter(zip(self.field_plan(), self.to_row()))
+
+ def iterkeys(self):
+  return iter(AppTable.columns)
+
+ def itervalues(self):
+  for k, v in self.iteritems():
+   yield v
+
+ def keys(self):
+  return list(AppTable.columns)
+
+ def values(self):
+  return list(self.itervalues())
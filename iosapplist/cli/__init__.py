@@ -34,6 +34,7 @@
 
 from __future__ import with_statement
 
+import threading
 import types
 
 from ..app import App
@@ -55,17 +56,40 @@ class CLI(CLI):
  program = "iosapplist"
  version = pkg_version
  
- app_class = App
- app_root  = None
+ app_class     = App
+ app_root      = None
+ app_workers   = None
+ app_processes = None
+ app_cache_dir = None
  
  __app_list = None
+ __app_list_lock = threading.Lock()
  @property
  def app_list(self):
-  if not self.__app_list:
-   root = ContainerRoot(self.app_root or "/var/mobile")
-   self.__app_list = AppList(root=root)
-   self.app_root = self.__app_list.root.path
+  # The lock keeps commands running in different threads (see the shell's
+  # request IDs) from each making their own AppList
+  with self.__app_list_lock:
+   if not self.__app_list:
+    root = ContainerRoot(self.app_root or "/var/mobile")
+    self.__app_list = AppList(root=root, workers=self.app_workers,
+                              processes=self.app_processes,
+                              cache_dir=self.app_cache_dir)
+    self.app_root = self.__app_list.root.path
   return self.__app_list
+ 
+ __projected_app_lists = None
+ def projected_app_list(self, fields):
+  """Returns a version of app_list that only loads the given fields (see
+AppList.projected()).  It is kept and reused for the same set of fields, so
+that e.g. repeated commands in the shell don't each scan the root again."""
+  app_list = self.app_list
+  with self.__app_list_lock:
+   if self.__projected_app_lists is None:
+    self.__projected_app_lists = {}
+   key = frozenset(fields)
+   if key not in self.__projected_app_lists:
+    self.__projected_app_lists[key] = app_list.projected(fields)
+   return self.__projected_app_lists[key]
 
 import commands
 CLI.commands.register(commands)
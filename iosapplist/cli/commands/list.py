@@ -39,11 +39,25 @@ __all__ = ["ListCommand"]
 class ListCommand(Command):
  """Shows information about one or more App Store apps (all apps by default)."""
  names = ["list", "ls"]
- usage = "[-l/--long] [--[list-]keys] [--<key>] [<bundle-id-or-uuid> [...]]"
+ usage = "[-l/--long] [-U/--unsorted] [-m/--match|-M/--match-name] [-w/--where <condition> [...]] [--[list-]keys] [--<key>] [<bundle-id-or-uuid-or-pattern> [...]]"
  
  def add_args(self, p, cli):
   p.add_argument("-l", "--long", action="store_true",
                  help="""List more information about each app.""")
+  p.add_argument("-U", "--unsorted", action="store_true",
+                 help="""Show each app as soon as it is found, in no particular
+                         order.""")
+  p.add_argument("-m", "--match", action="store_true",
+                 help="""Show the apps whose bundle IDs start with each query,
+                         or match it if it has wildcards (e.g. com.example.*).""")
+  p.add_argument("-M", "--match-name", action="store_true", dest="match_name",
+                 help="""Like -m/--match, but match app names instead of bundle
+                         IDs, ignoring case and diacritical marks.""")
+  p.add_argument("-w", "--where", action="append", default=[],
+                 help="""Only show apps that meet the given condition:
+                         key=value, key!=value, key^=prefix,
+                         key~=substring (ignoring case), key (true), or
+                         !key (false).  May be given more than once.""")
   p.add_argument("--list-keys", "--keys", action="store_true", dest="list_keys",
                  help="""Show a list of valid information keys.""")
   return p.parse_known_args
@@ -82,28 +96,83 @@ class ListCommand(Command):
      yield output.error("invalid key %s" % repr(key))
      raise StopIteration(2)
  
-   if not cli.app_list:
+   apps = cli.app_list
+   match = self.options.match or self.options.match_name
+   if (key and not apps and not self.options.where and not match and
+       (self.options.unsorted or search)):
+    # only load what is needed to show the key (when sorting, the whole list
+    # is loaded instead, since sort_key needs Info.plist anyway)
+    debug("only loading the field", key)
+    apps = cli.projected_app_list([key])
+   
+   where = None
+   if self.options.where:
+    try:
+     where = apps.where(*self.options.where)
+    except ValueError, exc:
+     yield output.error(str(exc))
+     raise StopIteration(2)
+   
+   stream = self.options.unsorted and not search and where is None
+   if not apps and not stream and not search:
     debug("populating the app list cache")
-    cli.app_list.find_all()
+    apps.find_all()
+    debug("system calls made by the scan:", apps.scan_syscalls)
    if search:
-    # search for some apps
-    debug("listing some apps")
-    results = [(query, cli.app_list.get(query, None)) for query in search]
+    if match:
+     # search for apps by bundle ID or name patterns
+     debug("listing apps that match patterns")
+     field = "name" if self.options.match_name else "bundle_id"
+     def find(pattern):
+      if [c for c in "*?[" if c in pattern]:
+       return apps.match(pattern, field)
+      return apps.find_prefix(pattern, field)
+     results = [(pattern, find(pattern)) for pattern in search]
+     not_found = "could not find any apps that match %s"
+    else:
+     # search for some apps
+     debug("listing some apps")
+     results = [(query, [app] if app else [])
+                for query, app in zip(search, apps.find_many(search))]
+     not_found = "could not find an app that matches %s"
     n_matches = 0
-    for query, match in results:
-     if not match:
-      yield output.error("could not find an app that matches %s" % repr(query))
+    for query, matches in results:
+     if not matches:
+      yield output.error(not_found % repr(query))
       if not self.is_robot:
        yield output.error("")
      else:
       n_matches += 1
     if not n_matches:
      raise StopIteration(1)
-    app_list = (match for query, match in results if match)
+    seen = set()
+    app_list = []
+    for query, matches in results:
+     if match:
+      # patterns can overlap, so show each app once
+      matches = [app for app in matches if app.bundle_id not in seen]
+      seen.update([app.bundle_id for app in matches])
+     app_list += matches
+    if match and not self.options.unsorted:
+     app_list.sort(key=lambda app: app.sort_key)
+   elif where is not None:
+    # show all apps that meet the conditions
+    debug("listing apps that meet conditions")
+    app_list = where
+    if not self.options.unsorted:
+     app_list = sorted(app_list, key=lambda app: app.sort_key)
+   elif stream:
+    # show all apps as they are found (or in cache order if already cached)
+    debug("listing all apps unsorted")
+    app_list = apps if apps else apps.iter_apps()
    else:
     # show all apps
     debug("listing all apps")
-    app_list = cli.app_list.sorted()
+    app_list = apps.sorted()
+   
+   if search and where is not None:
+    where_ids = set([id(app) for app in where])
+    app_list = (app for app in app_list if id(app) in where_ids)
    
    debug("outputting the list")
    for app in app_list:
@@ -119,7 +188,7 @@ class ListCommand(Command):
       raise StopIteration(2)
     else:
      if self.is_robot:
-      yield output.normal(dict(app))
+      yield output.normal(app.to_dict())
      else:
       yield output.normal(app.info_str(self.options.long))
    
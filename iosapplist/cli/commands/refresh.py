@@ -34,6 +34,7 @@ import code
 import sys
 
 from .. import Command, output, debug
+from ...util import propertylist
 
 
 __all__ = ["RefreshListCommand"]
@@ -47,5 +48,8 @@ class RefreshListCommand(Command):
  
  def main(self, cli):
   debug("re-populating the app list cache")
-  cli.app_list.find_all()
+  cli.app_list.refresh()
+  debug("system calls made by the scan:", cli.app_list.scan_syscalls)
+  debug("plist parse cache hits/misses:", propertylist.parse_cache.hits,
+        propertylist.parse_cache.misses)
   raise StopIteration(0)
@@ -42,9 +42,24 @@ class ShellCommand(ShellCommand):
   p.add_argument("--root", "-r", default="", metavar='<path>',
                  help='The path to the directory containing app containers or'
                       ' a mobile home directory (defaults to "/var/mobile").')
+  p.add_argument("--workers", "-j", type=int, default=None, metavar='<n>',
+                 help='The number of threads to use to scan for apps'
+                      ' concurrently (defaults to 1, i.e. no concurrency).')
+  p.add_argument("--processes", "-P", type=int, default=None, metavar='<n>',
+                 help='The number of processes to use to read plist files'
+                      ' in parallel (defaults to 1, i.e. no parallelism).')
+  p.add_argument("--cache-dir", default=None, metavar='<path>',
+                 help='A directory in which to keep a persistent cache of'
+                      ' app information between runs (disabled by default).')
   return parse_function
  def main(self, cli):
   output_generator = super(ShellCommand, self).main(cli)
   if cli.app_root is None:
    cli.app_root = self.options.root
+  if cli.app_workers is None:
+   cli.app_workers = self.options.workers
+  if cli.app_processes is None:
+   cli.app_processes = self.options.processes
+  if cli.app_cache_dir is None:
+   cli.app_cache_dir = self.options.cache_dir
   return output_generator
@@ -0,0 +1,76 @@
+# iosapplist
+# A Python package that lists iOS App Store apps.  (Formerly part of AppBackup.)
+#
+# Copyright (C) 2008-2014 Scott Zeid
+# https://s.zeid.me/projects/appbackup/
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# 
+# Except as contained in this notice, the name(s) of the above copyright holders
+# shall not be used in advertising or otherwise to promote the sale, use or
+# other dealings in this Software without prior written authorization.
+
+# watch command
+
+from __future__ import with_statement
+
+from .. import Command, output, debug
+
+
+__all__ = ["WatchCommand"]
+
+
+class WatchCommand(Command):
+ """Shows apps as they are installed, removed, or changed until interrupted."""
+ names = ["watch"]
+ usage = "[-i/--interval <seconds>] [--poll] [-n/--count <n>]"
+ sort_group = -3
+ 
+ event_prefixes = {"added": "+", "removed": "-", "changed": "*"}
+ 
+ def add_args(self, p, cli):
+  p.add_argument("-i", "--interval", type=float, default=None, metavar="<seconds>",
+                 help="""How often to check for changes when polling (default 2).""")
+  p.add_argument("--poll", action="store_true",
+                 help="""Poll for changes instead of using inotify.""")
+  p.add_argument("-n", "--count", type=int, default=0, metavar="<n>",
+                 help="""Exit after showing this many changes.""")
+ 
+ def main(self, cli):
+  debug("watching the app list")
+  n_events = 0
+  try:
+   for event in cli.app_list.watch(self.options.interval, poll=self.options.poll):
+    if self.is_robot:
+     # each event is its own robot document, since this never finishes
+     value = dict(event=event.type, bundle_id=event.bundle_id,
+                  app=dict(event.app))
+     cmd = output.OutputCommand(cli)
+     cmd.stdin, cmd.stdout, cmd.stderr = self.stdin, self.stdout, self.stderr
+     cmd.run([self.argv[0], "0", value])
+     self.stdout.flush()
+    else:
+     prefix = self.event_prefixes.get(event.type, "?")
+     yield output.normal(u"%s %s" % (prefix, event.app.info_str(False)))
+    n_events += 1
+    if self.options.count and n_events >= self.options.count:
+     break
+  except KeyboardInterrupt:
+   pass
+  raise StopIteration(0)
@@ -43,7 +43,7 @@ try:
 except ImportError:
  import simplejson as json
 
-from ...util import safe_print
+from ...util import msgpack_lite, propertylist, safe_print
 
 import output
 
@@ -211,9 +211,18 @@ class Command(object):
   robot_output = dict(cmd=argv[0], success=None, return_code=None,
                       output={"normal": [], "error": [], "traceback": []})
   
+  # ndjson output is written one item at a time as it is generated, instead of
+  # all at once at the end, so only tracebacks are kept in robot_output
+  stream = self.output_format == "ndjson" and not return_output
+  
   for item in self.generate_output(argv):
    value = item.value
-   if self.is_robot or return_output:
+   if stream:
+    if item.type == "traceback":
+     robot_output["output"][item.type] += [value]
+    self.stdout.write(json.dumps(dict(type=item.type, value=value)) + "\n")
+    self.stdout.flush()
+   elif self.is_robot or return_output:
     robot_output["output"][item.type] += [value]
    else:
     if isinstance(value, dict):
@@ -232,16 +241,35 @@ class Command(object):
   
   if self.is_robot or return_output:
    if not return_output:
-    if self.output_format == "plist":
-     print >> self.stdout, plistlib.writePlistToString(robot_output)
-    elif self.output_format == "json":
-     print >> self.stdout, json.dumps(robot_output)
-    elif self.output_format == "python-repr":
-     print >> self.stdout, repr(robot_output)
+    if self.output_format == "ndjson":
+     trailer = dict(cmd=robot_output["cmd"], return_code=self.return_code,
+                    success=robot_output["success"])
+     print >> self.stdout, json.dumps(trailer)
     else:
-     raise ValueError("bad output format %s" % repr(self.output_format))
+     self.stdout.write(self.format_robot_output(robot_output))
+    self.stdout.flush()
   
   return robot_output if return_output else self.return_code
+ 
+ def format_robot_output(self, robot_output, format=None):
+  """Returns robot_output serialized in the given format (default: output_format).
+
+Text formats end with a newline.  For ndjson, the whole document is given as
+one JSON line, unlike the line per item of output that run() writes.
+
+"""
+  format = format or self.output_format
+  if format == "plist":
+   return plistlib.writePlistToString(robot_output) + "\n"
+  elif format == "bplist":
+   return propertylist.save_to_string(robot_output, binary=True)
+  elif format == "msgpack":
+   return msgpack_lite.packb(robot_output)
+  elif format in ("json", "ndjson"):
+   return json.dumps(robot_output) + "\n"
+  elif format == "python-repr":
+   return repr(robot_output) + "\n"
+  raise ValueError("bad output format %s" % repr(format))
 
  def _parse_args(self, cli):
   out = []
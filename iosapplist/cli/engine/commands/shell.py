@@ -30,15 +30,16 @@
 
 from __future__ import with_statement
 
+import Queue
 import argparse
-import array
 import errno
 import math
-import plistlib
 import re
 import readline
 import shlex
+import struct
 import sys
+import threading
 
 try:
  import json
@@ -48,6 +49,8 @@ import traceback
 
 from .. import Command, output, debug
 from ..cli import CLIError
+from ..framing import FrameReader
+from ....util import msgpack_lite, propertylist
 
 
 __all__ = ["ShellCommand"]
@@ -61,6 +64,140 @@ def sign(n):
  return 0
 
 
+class _FrameBuffer(object):
+ # Collects the output of one shell command so that it can be written as one
+ # frame.  Unicode is encoded the way the real output file would encode it.
+ 
+ def __init__(self, encoding=None):
+  self.encoding = encoding
+  self.__data = []
+ 
+ def write(self, data):
+  if isinstance(data, unicode):
+   data = data.encode(self.encoding or "ascii")
+  self.__data.append(data)
+ 
+ def flush(self):
+  pass
+ 
+ def getvalue(self):
+  return "".join(self.__data)
+
+
+class _Pipeline(object):
+ # Runs shell commands that have request IDs on a pool of worker threads, and
+ # writes each one's robot output, with the request ID added, as soon as it is
+ # done.  A request that has a timeout gets an error response if it is not
+ # done in time after a worker starts running it.  Threads can't be stopped,
+ # so the command keeps running and its output is dropped when it finishes;
+ # meanwhile, a new worker takes the place of the one running it, so that the
+ # pool doesn't fill up with timed-out commands.  The old worker exits once
+ # the command finishes.
+ 
+ timeout_return_code = 124
+ 
+ def __init__(self, shell, cli, workers, write, default=None.__class__,
+              tracebacks_to_stderr=False):
+  self.shell = shell
+  self.cli   = cli
+  self.write = write
+  self.default = default
+  self.tracebacks_to_stderr = tracebacks_to_stderr
+  self.queue = Queue.Queue()
+  self.cond  = threading.Condition()
+  self.pending = {}  # maps request keys to IDs for requests not yet answered
+  self.next_key = 0
+  for i in xrange(max(workers or 1, 1)):
+   self.__start_worker()
+ 
+ def submit(self, request):
+  """Queues a request, which is a dictionary with "id", "argv", and "timeout"."""
+  with self.cond:
+   key = self.next_key
+   self.next_key += 1
+   self.pending[key] = request.get("id", None)
+  argv = request.get("argv", None)
+  timeout = request.get("timeout", None)
+  if timeout is not None:
+   try:
+    timeout = float(timeout)
+   except (TypeError, ValueError):
+    timeout = None
+    argv = None
+  self.queue.put((key, argv, timeout))
+ 
+ def wait(self):
+  """Waits until every request that has been submitted has been answered."""
+  with self.cond:
+   while self.pending:
+    self.cond.wait(1)
+ 
+ def __start_worker(self):
+  thread = threading.Thread(target=self.__work)
+  thread.setDaemon(True)
+  thread.start()
+ 
+ def __work(self):
+  while True:
+   key, argv, timeout = self.queue.get()
+   timer = None
+   if timeout is not None:
+    timer = threading.Timer(timeout, self.__time_out, (key, argv, timeout))
+    timer.setDaemon(True)
+    timer.start()
+   response = self.__run(argv)
+   if timer is not None:
+    timer.cancel()
+   if not self.__answer(key, response):
+    # the request timed out, and another worker has taken this one's place
+    return
+ 
+ def __run(self, argv):
+  try:
+   if (not isinstance(argv, list) or not argv
+       or [i for i in argv if not isinstance(i, basestring)]):
+    raise CLIError("argv must be a non-empty list of strings, and timeout must"
+                   " be a number")
+   cmd, argv = self.cli._lookup(argv, self.shell, self.default)
+   response = cmd.run(argv, return_output=True)
+  except CLIError, exc:
+   response = self.__response(argv, 2, error=self.shell.format_cli_error(self.cli, exc))
+  except Exception, exc:
+   response = self.__response(argv, 127, traceback=traceback.format_exc())
+  if self.tracebacks_to_stderr:
+   for i in response["output"]["traceback"]:
+    print >> self.shell.stderr, i
+  return response
+ 
+ def __time_out(self, key, argv, timeout):
+  message = "the command timed out after %g seconds" % timeout
+  if self.__answer(key, self.__response(argv, self.timeout_return_code,
+                                        error=message)):
+   self.__start_worker()
+ 
+ def __answer(self, key, response):
+  # Writes the response unless the request has already been answered, and
+  # returns whether it was written
+  with self.cond:
+   if key not in self.pending:
+    return False
+   response["id"] = self.pending.pop(key)
+   try:
+    self.write(response)
+   except Exception:
+    pass
+   finally:
+    self.cond.notify_all()
+   return True
+ 
+ @staticmethod
+ def __response(argv, return_code, error=None, traceback=None):
+  cmd = argv[0] if isinstance(argv, list) and argv else None
+  return dict(cmd=cmd, success=False, return_code=return_code,
+              output={"normal": [], "error": [error] if error else [],
+                      "traceback": [traceback] if traceback else []})
+
+
 class ShellCommand(Command):
  """Starts an interactive shell."""
  
@@ -92,18 +229,46 @@ class ShellCommand(Command):
    p.add_argument("--version", "-V", action="store_true",
                   help="show program's version number and exit")
   if self.__is_shell:
-   p.add_argument("--ps1", default="> ",
+   p.add_argument("--ps1", default=None,
                   help='The string to use to prompt for shell input ("> " by'
-                       ' default).  -0 supersedes this option.')
+                       ' default, or nothing with --length-prefixed).  -0'
+                       ' supersedes this option.')
    p.add_argument("-0", "--null", action="store_true",
                   help='Prompt for and terminate shell input with a null byte'
                        ' instead of, respectively, ps1 and a newline.  Useful'
                        ' in conjunction with --robot.')
+   p.add_argument("--length-prefixed", action="store_true",
+                  help='Read each command as a 4-byte big-endian length'
+                       ' followed by that many bytes, instead of reading'
+                       ' until a delimiter, and write the output of each'
+                       ' command the same way.  This is always done with'
+                       ' --robot bplist or --robot msgpack.')
    p.add_argument("--tracebacks-to-stderr", action="store_true",
                   help='Also echo tracebacks to standard error.')
+   p.add_argument("--pipeline-workers", type=int, default=4, metavar='<n>',
+                  help='The number of commands with request IDs to run at'
+                       ' the same time (4 by default).  With --robot, a'
+                       ' command can be given as a dictionary with the keys'
+                       ' "id", "argv", and optionally "timeout" (in seconds)'
+                       ' instead of a list.  Such commands are run in the'
+                       ' background, and each one\'s output is written as'
+                       ' soon as it is done, with its "id", in any order'
+                       ' (after its length with --length-prefixed, or followed'
+                       ' by a null byte with -0).  Commands without IDs wait'
+                       ' for them to finish.  After the first command with'
+                       ' an ID, prompts are no longer written, and with -0,'
+                       ' the output of every command is followed by a null'
+                       ' byte instead.  The timeout starts when a worker'
+                       ' starts running the command.  A command that times'
+                       ' out cannot be stopped, so another worker is started'
+                       ' in place of the one still running it.')
   p.add_argument("--robot", default="", metavar='<format>',
                  help='Produce output suitable for robots.'
-                      '  Format should be "plist" or "json".')
+                      '  Format should be "plist", "json", "ndjson",'
+                      ' "bplist" (binary plist), or "msgpack" (MessagePack).'
+                      '  ndjson writes each item of output as a JSON object'
+                      ' on its own line as soon as it is made, followed by'
+                      ' a line with the return code.')
   p.formatter_class = argparse.RawDescriptionHelpFormatter
   if not self.__is_shell and self.__want_help:
    p.epilog = "commands"
@@ -163,9 +328,42 @@ class ShellCommand(Command):
   null = getattr(self.options, "null", False)
   ps1 = getattr(self.options, "ps1", "")
   tracebacks_to_stderr = getattr(self.options, "tracebacks_to_stderr", False)
+  input_format = self.real_output_format
+  length_prefixed = getattr(self.options, "length_prefixed", False)
+  length_prefixed = length_prefixed or input_format in ("bplist", "msgpack")
+  pipeline = None
+  pipeline_workers = getattr(self.options, "pipeline_workers", 4)
   self.__use_real_output_format = False
+  stdout = self.stdout
+  write_lock = threading.Lock()
+  
+  def write_frame(data):
+   # Writes the output of one command, framed like the input
+   if length_prefixed:
+    data = struct.pack(FrameReader.length_format, len(data)) + data
+   elif null:
+    data += "\0"
+   with write_lock:
+    stdout.write(data)
+    stdout.flush()
+  
+  def write_response(response):
+   # Writes the output of a command with a request ID
+   write_frame(self.format_robot_output(response, input_format))
+  
   try:
-   ps1 = "\0" if null else ps1
+   if null:
+    ps1 = "\0"
+   elif ps1 is None:
+    ps1 = "" if length_prefixed else "> "
+   
+   # Commands are read with a FrameReader, except from an interactive
+   # terminal, where raw_input() is used so that readline works.  XML plist
+   # commands end with "</plist>" unless another kind of framing is used.
+   reader = FrameReader(self.stdin)
+   plist_marker = "</plist>" if input_format == "plist" else None
+   interactive = (self.stdin == sys.stdin and not null and not length_prefixed
+                  and not plist_marker and self.stdin.isatty())
    
    one_command = self.extra if len(self.extra) else False
    if not self.__is_shell and not one_command:
@@ -182,111 +380,126 @@ class ShellCommand(Command):
      yield output.normal(self.version_string(cli))
      raise StopIteration(0)
    
-   build = ""
    real_command = None
-   while True:
-    real_command = True
-    try:
-     if one_command == False:
-      try:
-       if null:
-        self.stdout.write("\0")
-        self.stdout.flush()
-        line = array.array('c')
-        while True:
-         char = self.stdin.read(1)
-         if char == "":
-          raise EOFError()
-         elif char != "\0":
-          line.fromstring(char)
-         else:
-          break
-        line = line.tostring()
-       else:
-        self.stdout.write(ps1 if not build else "")
-        self.stdout.flush()
-        if self.stdin == sys.stdin:
+   try:
+    while True:
+     real_command = True
+     # the output of each command read with --length-prefixed (or with -0,
+     # once prompts are no longer written) is collected here and then written
+     # as one frame
+     frame = None
+     try:
+      if one_command == False:
+       try:
+        # prompts are not written once commands with request IDs are used,
+        # since their output can come at any time
+        if pipeline is None:
+         self.stdout.write(ps1)
+         self.stdout.flush()
+        if interactive:
          line = raw_input()
+        elif length_prefixed:
+         line = reader.read_length_prefixed()
+        elif null:
+         line = reader.read_until("\0")
+        elif plist_marker:
+         line = reader.read_until(plist_marker, keep=True).lstrip()
+         if not line:
+          continue
         else:
-         line = self.stdin.readline()
-         if line.endswith("\n"):
-          line = line[:-1]
-      except EOFError:
-       raise
-      except:
-       one_command = True  # make the main loop break
-       raise
-     if one_command != False:
-      argv = one_command
-     elif self.real_output_format == "plist":
-      if self.options.null:
-       argv = plistlib.readPlistFromString(line)
+         line = reader.read_until("\n")
+       except EOFError:
+        raise
+       except:
+        one_command = True  # make the main loop break
+        raise
+       if length_prefixed or (null and pipeline is not None):
+        frame = self.stdout = _FrameBuffer(getattr(stdout, "encoding", None))
+      if one_command != False:
+       argv = one_command
+      elif input_format in ("plist", "bplist"):
+       argv = propertylist.load_from_string(line)
+      elif input_format in ("json", "ndjson", "python-repr"):
+       argv = json.loads(line)
+      elif input_format == "msgpack":
+       argv = msgpack_lite.unpackb(line)
       else:
-       build += line + "\n"
-       if "</plist>" in line:
-        argv = plistlib.readPlistFromString(build)
-        build = ""
-       else:
-        continue
-     elif self.real_output_format in ("json", "python-repr"):
-      argv = json.loads(line)
-     else:
-      argv = shlex.split(line)
-     if len(argv) == 1 and self.__is_shell:
-      if argv[0] not in cli.commands:
-       if one_command == False:
-        if argv[0] == "exit":
-         raise StopIteration(0)
-       if argv[0] == "help":
-        real_command = False
-        message = self.help_string(cli, True)
-        self.cmd(output.OutputCommand).run([self.argv[0], "0", message])
-       if self.easter_eggs and argv[0] == "hep":
-        argv[0] = "--hep"
-        argv = ["sh"] + argv
-       if argv[0] == "version":
-        real_command = False
-        message = self.version_string(cli)
-        self.cmd(output.OutputCommand).run([self.argv[0], "0", message])
-     elif not len(argv) and one_command == False:
-      continue
-     r = 127
-     if real_command:
-      r, cmd = cli.start(argv, self, default=(None if self.__is_shell else None.__class__),
-                         verbose_return=True)
-      if tracebacks_to_stderr and cmd.robot_output:
-       tbs = cmd.robot_output.get("output", {}).get("traceback", [])
-       if tbs:
-        for i in tbs:
-         print >> self.stderr, i
-     if one_command != False:
+       argv = shlex.split(line)
+      if isinstance(argv, dict) and one_command == False:
+       # a command with a request ID
+       if pipeline is None:
+        default = None if self.__is_shell else None.__class__
+        pipeline = _Pipeline(self, cli, pipeline_workers, write_response,
+                             default, tracebacks_to_stderr)
+       pipeline.submit(argv)
+       frame = None
+       continue
+      if pipeline is not None:
+       pipeline.wait()
+      if len(argv) == 1 and self.__is_shell:
+       if argv[0] not in cli.commands:
+        if one_command == False:
+         if argv[0] == "exit":
+          frame = None
+          raise StopIteration(0)
+        if argv[0] == "help":
+         real_command = False
+         message = self.help_string(cli, True)
+         self.cmd(output.OutputCommand).run([self.argv[0], "0", message])
+        if self.easter_eggs and argv[0] == "hep":
+         argv[0] = "--hep"
+         argv = ["sh"] + argv
+        if argv[0] == "version":
+         real_command = False
+         message = self.version_string(cli)
+         self.cmd(output.OutputCommand).run([self.argv[0], "0", message])
+      elif not len(argv) and one_command == False:
+       frame = None
+       continue
+      r = 127
       if real_command:
-       raise StopIteration(r)
-      else:
-       raise StopIteration(0)
-    except EOFError:
-     raise StopIteration(0)
-     break
-    except CLIError, exc:
-     message = self.format_cli_error(cli, exc)
-     self.cmd(output.OutputCommand).run([self.argv[0], "2", "", message])
-     if one_command != False:
-      raise StopIteration(2)
-    except StopIteration:
-     raise
-    except Exception, exc:
-     if isinstance(exc, IOError) and exc.errno == errno.EPIPE:
+       r, cmd = cli.start(argv, self, default=(None if self.__is_shell else None.__class__),
+                          verbose_return=True)
+       if tracebacks_to_stderr and cmd.robot_output:
+        tbs = cmd.robot_output.get("output", {}).get("traceback", [])
+        if tbs:
+         for i in tbs:
+          print >> self.stderr, i
+      if one_command != False:
+       if real_command:
+        raise StopIteration(r)
+       else:
+        raise StopIteration(0)
+     except EOFError:
       raise StopIteration(0)
       break
-     tb = traceback.format_exc()
-     try:
-      self.cmd(output.OutputCommand).run([self.argv[0], "127", "", "", tb])
-     except:
-      pass
-     if tracebacks_to_stderr:
-      print >> self.stderr, tb
-     if one_command != False:
-      raise StopIteration(127)
+     except CLIError, exc:
+      message = self.format_cli_error(cli, exc)
+      self.cmd(output.OutputCommand).run([self.argv[0], "2", "", message])
+      if one_command != False:
+       raise StopIteration(2)
+     except StopIteration:
+      raise
+     except Exception, exc:
+      if isinstance(exc, IOError) and exc.errno == errno.EPIPE:
+       raise StopIteration(0)
+       break
+      tb = traceback.format_exc()
+      try:
+       self.cmd(output.OutputCommand).run([self.argv[0], "127", "", "", tb])
+      except:
+       pass
+      if tracebacks_to_stderr:
+       print >> self.stderr, tb
+      if one_command != False:
+       raise StopIteration(127)
+     finally:
+      self.stdout = stdout
+      if frame is not None:
+       write_frame(frame.getvalue())
+   finally:
+    if pipeline is not None:
+     pipeline.wait()
    raise StopIteration(0)
   except CLIError, exc:
    yield output.error(self.format_cli_error(cli, exc))
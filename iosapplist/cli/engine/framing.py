@@ -0,0 +1,130 @@
+# iosapplist
+# A Python package that lists iOS App Store apps.  (Formerly part of AppBackup.)
+#
+# Copyright (C) 2008-2014 Scott Zeid
+# https://s.zeid.me/projects/appbackup/
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# 
+# Except as contained in this notice, the name(s) of the above copyright holders
+# shall not be used in advertising or otherwise to promote the sale, use or
+# other dealings in this Software without prior written authorization.
+
+# Input framing
+
+from __future__ import with_statement
+
+import errno
+import os
+import struct
+
+
+__all__ = ["FrameReader"]
+
+
+class FrameReader(object):
+ """Reads frames (such as shell commands) from a file in large chunks.
+
+Frames can be delimited (e.g. by newlines or null bytes), end with a marker
+(e.g. "</plist>"), or be length-prefixed (a 4-byte big-endian length followed
+by that many bytes).  Data is read with os.read() from the file's descriptor
+whenever it has one, which returns as soon as any data is available, so a
+reader never waits for more input than the next frame needs.  Delimiters and
+markers can be split across chunks, and each byte is only searched once.
+
+"""
+ 
+ chunk_size = 65536
+ length_format = ">I"
+ 
+ def __init__(self, f, chunk_size=None):
+  self.__file   = f
+  self.__buffer = ""
+  self.__pos    = 0
+  if chunk_size:
+   self.chunk_size = chunk_size
+  try:
+   self.__fd = f.fileno()
+  except (AttributeError, IOError, ValueError):
+   self.__fd = None
+ 
+ def read_until(self, delimiter, keep=False):
+  """Returns the data up to the next delimiter.
+
+The delimiter is removed from the input, and it is included at the end of the
+frame if keep is True.  If the input ends before a delimiter, then the rest of
+the input is returned.  Raises EOFError if there is no more input.
+
+"""
+  scanned = 0  # bytes after self.__pos that are known not to start a delimiter
+  while True:
+   i = self.__buffer.find(delimiter, self.__pos + scanned)
+   if i != -1:
+    end = i + len(delimiter)
+    frame = self.__buffer[self.__pos:end if keep else i]
+    self.__pos = end
+    return frame
+   scanned = max(0, len(self.__buffer) - self.__pos - len(delimiter) + 1)
+   if not self.__fill():
+    return self.__rest()
+ 
+ def read_exactly(self, n):
+  """Returns the next n bytes, or raises EOFError if the input ends first."""
+  while len(self.__buffer) - self.__pos < n:
+   if not self.__fill():
+    self.__rest()
+    raise EOFError()
+  frame = self.__buffer[self.__pos:self.__pos + n]
+  self.__pos += n
+  return frame
+ 
+ def read_length_prefixed(self):
+  """Returns the next length-prefixed frame, or raises EOFError at the end."""
+  header = self.read_exactly(struct.calcsize(self.length_format))
+  return self.read_exactly(struct.unpack(self.length_format, header)[0])
+ 
+ def __fill(self):
+  # Reads more input into the buffer, and returns False at the end of the input
+  while True:
+   try:
+    if self.__fd is not None:
+     data = os.read(self.__fd, self.chunk_size)
+    else:
+     data = self.__file.read(self.chunk_size)
+    break
+   except (IOError, OSError), exc:
+    if exc.errno != errno.EINTR:
+     raise
+  if not data:
+   return False
+  if self.__pos:
+   self.__buffer = self.__buffer[self.__pos:] + data
+   self.__pos = 0
+  else:
+   self.__buffer += data
+  return True
+ 
+ def __rest(self):
+  # Returns and removes the rest of the buffer, or raises EOFError if it is empty
+  rest = self.__buffer[self.__pos:]
+  self.__buffer = ""
+  self.__pos = 0
+  if not rest:
+   raise EOFError()
+  return rest
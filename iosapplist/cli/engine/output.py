@@ -86,28 +86,33 @@ def item(type, value, human=None):
 
 
 class _OutputItem(object):
+ # A read-only record of one item of output.  This is made for every line of
+ # output, so it is kept as small and cheap to make as possible.
  __doc__ = None
- def __new__(cls, type, value, human):
-  # hack hack hackity hack
-  class item(cls):
-   __doc__ = cls.__doc__
-   def __new__(item_cls):
-    return object.__new__(item_cls)
-   @property
-   def type(self):
-    return type
-   @property
-   def value(self):
-    return value
-   @property
-   def human(self):
-    return human
-   def __repr__(self):
-    return "<%s (%s): %s>" % (cls.__name__, self.type, repr(self.value))
-   def __str__(self):
-    return repr(self)
-   def __unicode__(self):
-    return repr(self).decode("utf-8")
-  r = item()
-  r.__name__ = cls.__name__
-  return r
+ __slots__ = ["__type", "__value", "__human"]
+ 
+ def __init__(self, type, value, human):
+  self.__type  = type
+  self.__value = value
+  self.__human = human
+ 
+ @property
+ def type(self):
+  return self.__type
+ 
+ @property
+ def value(self):
+  return self.__value
+ 
+ @property
+ def human(self):
+  return self.__human
+ 
+ def __repr__(self):
+  return "<%s (%s): %s>" % (type(self).__name__, self.__type, repr(self.__value))
+ 
+ def __str__(self):
+  return repr(self)
+ 
+ def __unicode__(self):
+  return repr(self).decode("utf-8")
@@ -33,20 +33,26 @@ from __future__ import with_statement
 import os
 import re
 
+from util import fs
 from util import propertylist
 from util import *
 
 __all__ = [
+ "CONTAINER_METADATA_KEYS",
  "CONTAINER_METADATA_PLIST",
  "ContainerError",
  "Container",
  "ContainerClass",
  "ContainerRoot",
+ "find_app_bundle",
 ]
 
 
 CONTAINER_METADATA_PLIST = u".com.apple.mobile_container_manager.metadata.plist"
 
+# The keys in the metadata plist that Container actually uses
+CONTAINER_METADATA_KEYS = ("MCMMetadataContentClass", "MCMMetadataIdentifier")
+
 
 class ContainerError(Exception): pass
 
@@ -62,7 +68,9 @@ Attributes:
  uuid:      the directory name of the container; will be a UUID string
  path:      the full path of the container directory
  plist:     the path to the metadata plist
- metadata:  the contents of the metadata plist as a Python dictionary
+ metadata:  the contents of the metadata plist as a Python dictionary (only
+             the keys in CONTAINER_METADATA_KEYS are read), or None unless
+             keep_metadata=True was given to the constructor
 
 If class_ is ContainerClass.LEGACY, then that means it is not actually a
 container, but rather an old-style ~mobile/Applications subdirectory from
@@ -79,17 +87,47 @@ have their normal values, depending on the mood of the iOS developers.
 
 """
  
- def __init__(self, path):
-  """Loads the container's info.  path is the path to the container."""
+ __slots__ = [
+  "class_", "class_raw", "bundle_id", "uuid", "path", "plist", "metadata",
+  "__app_bundle"
+ ]
+ 
+ def __init__(self, path, find_bundle=True, keep_metadata=False):
+  """Loads the container's info.  path is the path to the container.
+
+If find_bundle is False, then the container directory is only listed if it
+has no metadata plist (i.e. if it is a legacy app directory), and otherwise
+find_app_bundle() lists it the first time it is called.
+
+If keep_metadata is True, then the metadata plist's contents are kept in the
+metadata attribute; otherwise, metadata is None once the container is loaded.
+
+"""
   self.path      = to_unicode(os.path.abspath(path))
   self.uuid      = os.path.basename(self.path).upper()
   self.plist     = os.path.join(self.path, CONTAINER_METADATA_PLIST)
   self.class_    = self.class_raw = None
   self.bundle_id = None
   self.metadata  = None
-  if os.path.isfile(os.path.realpath(self.plist)):
+  self.__app_bundle = None
+  has_plist = False
+  if not find_bundle:
+   has_plist = fs.isfile(self.plist)
+  if not has_plist:
+   # The container is listed once, and the listing is used both to find the
+   # metadata plist and to find the app bundle (if any) without further stat()s
    try:
-    self.metadata = propertylist.load(self.plist)
+    entries = fs.scandir(self.path)
+   except OSError, exc:
+    raise ContainerError(exc)
+   self.__app_bundle = _find_app_bundle(self.path, entries)
+   for entry in entries:
+    if entry.name == CONTAINER_METADATA_PLIST:
+     has_plist = entry.is_file()
+     break
+  if has_plist:
+   try:
+    self.metadata = propertylist.load_keys(self.plist, CONTAINER_METADATA_KEYS)
     if "MCMMetadataContentClass" in self.metadata:
      self.class_raw = self.metadata["MCMMetadataContentClass"]
      self.class_    = ContainerClass.get(self.class_raw, ContainerClass.UNKNOWN)
@@ -97,22 +135,54 @@ have their normal values, depending on the mood of the iOS developers.
      self.bundle_id = self.metadata["MCMMetadataIdentifier"]
    except propertylist.PropertyListError, exc:
     raise ContainerError(exc)
+   if not keep_metadata:
+    self.metadata = None
   else:
    self.plist     = None
    self.class_raw = ContainerClass.LEGACY.value
    self.class_    = ContainerClass.LEGACY
-   for i in os.listdir(self.path):
-    app_dir = os.path.realpath(os.path.join(self.path, i))
-    if (os.path.isdir(app_dir) and i.endswith(u".app")):
-     info_plist = os.path.join(app_dir, u"Info.plist")
-     try:
-      if os.path.isfile(os.path.realpath(info_plist)):
-       pl = propertylist.load(info_plist)
-       if "CFBundleIdentifier" in pl:
-        self.bundle_id = pl["CFBundleIdentifier"]
-     except propertylist.PropertyListError:
-      pass
-     break
+   name, info_plist = self.__app_bundle
+   if info_plist:
+    try:
+     if fs.isfile(info_plist):
+      pl = propertylist.load_keys(info_plist, ("CFBundleIdentifier",))
+      if "CFBundleIdentifier" in pl:
+       self.bundle_id = pl["CFBundleIdentifier"]
+    except propertylist.PropertyListError:
+     pass
+ 
+ def find_app_bundle(self):
+  """Returns the app bundle in the container, as found when it was loaded.
+
+See find_app_bundle() (the module-level function) for the return value.  If
+the container was loaded with find_bundle=False, then the app bundle is found
+the first time this is called.
+
+"""
+  if self.__app_bundle is None:
+   try:
+    self.__app_bundle = find_app_bundle(self.path)
+   except OSError:
+    return None, None
+  return self.__app_bundle
+
+
+def find_app_bundle(path):
+ """Finds the app bundle in the given container or legacy app directory.
+
+Returns a tuple of the name of the first ".app" directory in path and the path
+to its Info.plist file (which might not exist), or (None, None) if there is no
+app bundle.
+
+"""
+ return _find_app_bundle(path, fs.scandir(path))
+
+
+def _find_app_bundle(path, entries):
+ for entry in entries:
+  if entry.name.endswith(u".app") and entry.is_dir():
+   return entry.name, os.path.join(path, entry.name, u"Info.plist")
+ return None, None
 
 
 class ContainerClass(object):
@@ -161,26 +231,39 @@ Psuedo-classes:
  __names = []
  
  def __new__(cls, name, value):
-  # hack hack hackity hack
-  class item(cls):
-   __doc__ = cls.__doc__
-   def __new__(item_cls):
-    return object.__new__(item_cls)
-   @property
-   def name(self):
-    return name
-   @property
-   def value(self):
-    return value
-   def __repr__(self):
-    return "<%s.%s (value=%s)>" % (cls.__name__, self.name, repr(self.value))
-   def __str__(self):
-    return repr(self)
-   def __unicode__(self):
-    return repr(self).decode("utf-8")
-  r = item()
-  r.__name__ = cls.__name__
-  return r
+  # Each item is an instance of this class itself, and is only made once (by
+  # __add()), so the items can be compared by identity.
+  self = object.__new__(cls)
+  self.__name  = name
+  self.__value = value
+  return self
+ 
+ __slots__ = ["__name", "__value"]
+ 
+ @property
+ def name(self):
+  return self.__name
+ 
+ @property
+ def value(self):
+  return self.__value
+ 
+ @property
+ def __name__(self):
+  return type(self).__name__
+ 
+ def __repr__(self):
+  return "<%s.%s (value=%s)>" % (type(self).__name__, self.name, repr(self.value))
+ 
+ def __str__(self):
+  return repr(self)
+ 
+ def __unicode__(self):
+  return repr(self).decode("utf-8")
+ 
+ def __reduce__(self):
+  # Unpickling gives the same singleton
+  return (getattr, (ContainerClass, self.name))
  
  @classmethod
  def __add(cls, *args, **kwargs):
@@ -243,7 +326,7 @@ Attributes:
 """
  @staticmethod
  def _has_uuids(path):
-  for i in os.listdir(path):
+  for i in fs.listdir(path):
    if re.search(r"^[0-9a-f]{8}(-[0-9a-f]{4}){3}-[0-9a-f]{12}$", i, re.I):
     return True
   return False
@@ -264,7 +347,7 @@ of those (e.g. the "data" directory from an iOS Simulator instance).
   self.data_root   = None
   self.legacy_root = None
   
-  ls = os.listdir(path)
+  ls = fs.listdir(path)
   if "Containers" in ls:
    self.min_ios = 8
    self.path = os.path.join(path, "Containers")
@@ -283,28 +366,28 @@ of those (e.g. the "data" directory from an iOS Simulator instance).
     if parent_name == "Bundle":
      bundle_dir = path
      data_dir = os.path.join(grandparent, "Data", "Application")
-     if os.path.isdir(os.path.realpath(data_dir)):
+     if fs.isdir(data_dir):
       if self._has_uuids(bundle_dir) or self._has_uuids(data_dir):
        self.min_ios = 8
        self.path = grandparent
     elif parent_name == "Data":
      bundle_dir = os.path.join(grandparent, "Bundle", "Application")
      data_dir = path
-     if os.path.isdir(os.path.realpath(bundle_dir)):
+     if fs.isdir(bundle_dir):
       if self._has_uuids(data_dir) or self._has_uuids(bundle_dir):
        self.min_ios = 8
        self.path = grandparent
    elif input_name == "Bundle":
     bundle_dir = os.path.join(path, "Application")
     data_dir = os.path.join(parent, "Data", "Application")
-    if os.path.isdir(os.path.realpath(data_dir)):
+    if fs.isdir(data_dir):
      if self._has_uuids(bundle_dir) or self._has_uuids(data_dir):
       self.min_ios = 8
       self.path = parent
    elif input_name == "Data":
     bundle_dir = os.path.join(parent, "Bundle", "Application")
     data_dir = os.path.join(path, "Application")
-    if os.path.isdir(os.path.realpath(bundle_dir)):
+    if fs.isdir(bundle_dir):
      if self._has_uuids(data_dir) or self._has_uuids(bundle_dir):
       self.min_ios = 8
       self.path = parent
@@ -0,0 +1,190 @@
+# iosapplist
+# A Python package that lists iOS App Store apps.  (Formerly part of AppBackup.)
+#
+# Copyright (C) 2008-2014 Scott Zeid
+# https://s.zeid.me/projects/appbackup/
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# 
+# Except as contained in this notice, the name(s) of the above copyright holders
+# shall not be used in advertising or otherwise to promote the sale, use or
+# other dealings in this Software without prior written authorization.
+
+# ScanCache class
+
+from __future__ import with_statement
+
+import errno
+import marshal
+import os
+
+try:
+ from hashlib import sha1
+except ImportError:
+ from sha import new as sha1
+
+from util import propertylist
+from util import *
+
+__all__ = ["ScanCache"]
+
+
+class ScanCache(object):
+ """A persistent cache of the plist values read while scanning for apps.
+
+Attributes:
+ directory: the directory in which the cache file is stored
+ root_path: the ContainerRoot path that the cache belongs to
+ path:      the path to the cache file (one per root_path)
+ hints_path: the path to the bundle ID hints file (see load_hints())
+ hits:      the number of plists served from the cache since it was loaded
+ misses:    the number of plists that had to be parsed since it was loaded
+
+Each entry is keyed by the path to a plist file (and thereby by the path to
+its container) and holds the (inode, size, mtime) of the file along with the
+top-level plist keys that were requested for it.  An entry is only used if the
+file's inode, size, and mtime are unchanged and the same keys are requested.
+
+The cache files are written with marshal, which (unlike pickle) cannot run code
+when they are read, and files that are not owned by the current user are
+ignored, in case the cache directory is shared.  Values that marshal cannot
+store (such as dates) keep the cache from being saved.
+
+"""
+ version = 2
+ 
+ def __init__(self, directory, root_path):
+  self.directory = to_unicode(directory)
+  self.root_path = to_unicode(root_path)
+  name = sha1(self.root_path.encode("utf-8")).hexdigest()
+  self.path      = os.path.join(self.directory, name + ".cache")
+  self.hints_path = os.path.join(self.directory, name + ".hints")
+  self.hits      = 0
+  self.misses    = 0
+  self.__entries = None
+  self.__seen    = {}
+ 
+ def load(self):
+  """Reads the cache file, if it exists and is valid.  Returns self."""
+  self.__entries = self.__read(self.path).get("entries", {})
+  return self
+ 
+ def load_hints(self):
+  """Returns the bundle ID hints saved by save_hints().
+
+The hints are a dictionary mapping bundle IDs to tuples of the UUIDs of the
+app's bundle and data containers (which are the same for legacy apps).  They
+can be out of date, so they must be verified before being used.  If there is
+no valid hints file, an empty dictionary is returned.
+
+"""
+  return self.__read(self.hints_path).get("hints", {})
+ 
+ def save_hints(self, hints):
+  """Writes the given bundle ID hints (see load_hints()).  Returns self."""
+  self.__write(self.hints_path, dict(hints=hints))
+  return self
+ 
+ def load_many(self, filenames, keys, processes=1):
+  """Like propertylist.load_many(), but uses the cache for unchanged files.
+
+Files that are not in the cache or that have changed are decoded using
+propertylist.load_many() with the given number of processes, and the results
+are added to the cache.  Returns a dictionary mapping each file name to its
+value, leaving out files that don't exist or that aren't valid plists.
+
+"""
+  if self.__entries is None:
+   self.load()
+  keys = tuple(keys)
+  r = {}
+  misses = {}
+  for filename in filenames:
+   signature = file_signature(filename)
+   if signature is None:
+    continue
+   entry = self.__entries.get(filename, None)
+   if entry and entry[0] == signature and entry[1] == keys:
+    r[filename] = entry[2]
+    self.__seen[filename] = entry
+    self.hits += 1
+   else:
+    misses[filename] = signature
+  if misses:
+   self.misses += len(misses)
+   values = propertylist.load_many(misses.keys(), keys, processes)
+   for filename, value in values.iteritems():
+    r[filename] = value
+    self.__seen[filename] = (misses[filename], keys, value)
+  return r
+ 
+ def save(self):
+  """Writes the entries used or added since the last save to the cache file.
+
+Entries that were not looked up are kept if their files still exist (e.g. the
+Info.plist entries when only container metadata was needed), and dropped
+otherwise (e.g. because their containers were removed).  Errors are ignored,
+since the cache is only an optimization.  Returns self.
+
+"""
+  entries = self.__seen
+  for filename, entry in (self.__entries or {}).iteritems():
+   if filename not in entries and os.path.exists(filename):
+    entries[filename] = entry
+  self.__write(self.path, dict(entries=entries))
+  self.__entries = entries
+  self.__seen = {}
+  return self
+ 
+ def __read(self, path):
+  try:
+   f = open(path, "rb")
+   try:
+    if hasattr(os, "getuid") and os.fstat(f.fileno()).st_uid != os.getuid():
+     return {}
+    data = marshal.load(f)
+   finally:
+    f.close()
+  except (IOError, OSError, EOFError, ValueError, TypeError):
+   return {}
+  if (isinstance(data, dict) and data.get("version") == self.version
+      and data.get("root_path") == self.root_path):
+   return data
+  return {}
+ 
+ def __write(self, path, data):
+  data = dict(data, version=self.version, root_path=self.root_path)
+  tmp_path = "%s.%d.tmp" % (path, os.getpid())
+  try:
+   try:
+    os.makedirs(self.directory)
+   except OSError, exc:
+    if exc.errno != errno.EEXIST:
+     raise
+   f = open(tmp_path, "wb")
+   try:
+    marshal.dump(data, f)
+   finally:
+    f.close()
+   os.rename(tmp_path, path)
+  except (IOError, OSError, ValueError):
+   try:
+    os.remove(tmp_path)
+   except OSError:
+    pass
@@ -31,13 +31,16 @@
 
 from __future__ import with_statement
 
+import os
 import sys
 
+import fs
 import propertylist
 
 
-__all__  = ["escape_utf8", "safe_print", "strip_latin_diacritics", "to_unicode"]
-__all__ += ["propertylist"]
+__all__  = ["escape_utf8", "file_signature", "safe_print", "strip_latin_diacritics"]
+__all__ += ["strip_latin_diacritics_many", "to_unicode"]
+__all__ += ["fs", "propertylist"]
 
 
 # Table of Latin Diacritical Marks
@@ -80,6 +83,17 @@ def escape_utf8(s):
  return r
 
 
+def file_signature(path):
+ """Returns the (inode, size, mtime) of the given path, or None if it can't be
+stat()ed."""
+ fs.syscalls.add("stat")
+ try:
+  st = os.stat(path)
+ except OSError:
+  return None
+ return (st.st_ino, st.st_size, st.st_mtime)
+
+
 def safe_print(s, file=sys.stdout):
  """Prints the given string, compensating for Unicode errors."""
  try:
@@ -98,13 +112,65 @@ Letter to diacritical mark mappings are found in latin_diacritics.py and sourced
 from Wikipedia.
 
 """
- ret = to_unicode(s, errors="ignore")
- for letter in LATIN_DIACRITICS_TABLE:
-  for i in LATIN_DIACRITICS_TABLE[letter]:
-   ret = ret.replace(i, letter)
+ s = to_unicode(s, errors="ignore")
+ ret = _diacritics_memo.get(s, None)
+ if ret is None:
+  ret = _strip_latin_diacritics(s)
+  if len(_diacritics_memo) >= _DIACRITICS_MEMO_SIZE:
+   _diacritics_memo.clear()
+  _diacritics_memo[s] = ret
+ return ret
+
+
+def strip_latin_diacritics_many(strings):
+ """Like strip_latin_diacritics(), but for a sequence of strings at once.
+
+Returns a list of the results in the same order.  The strings that need to be
+changed are joined and translated in one pass.
+
+"""
+ strings = [to_unicode(s, errors="ignore") for s in strings]
+ ret = [_diacritics_memo.get(s, None) for s in strings]
+ todo = [i for i in xrange(len(strings)) if ret[i] is None]
+ if todo:
+  pending = [strings[i] for i in todo]
+  if any(u"\x00" in s for s in pending):
+   results = [_strip_latin_diacritics(s) for s in pending]
+  else:
+   results = _strip_latin_diacritics(u"\x00".join(pending)).split(u"\x00")
+  if len(_diacritics_memo) + len(todo) > _DIACRITICS_MEMO_SIZE:
+   _diacritics_memo.clear()
+  for i, result in zip(todo, results):
+   ret[i] = _diacritics_memo[strings[i]] = result
  return ret
 
 
+def _strip_latin_diacritics(s):
+ try:
+  s.encode("ascii")
+  return s
+ except UnicodeError:
+  pass
+ return s.translate(_DIACRITICS_MAP)
+
+
+def _make_diacritics_map():
+ # Returns a unicode.translate() table that maps each character in
+ # LATIN_DIACRITICS_TABLE to its letter.  Like the str.replace() loop that this
+ # replaces, each character (including each combining mark) is mapped on its
+ # own, and the first letter in the table's iteration order wins.
+ table = {}
+ for letter in LATIN_DIACRITICS_TABLE:
+  for c in LATIN_DIACRITICS_TABLE[letter]:
+   if c != letter:
+    table.setdefault(ord(c), unicode(letter))
+ return table
+
+_DIACRITICS_MAP = _make_diacritics_map()
+_DIACRITICS_MEMO_SIZE = 65536
+_diacritics_memo = {}
+
+
 def to_unicode(s, encoding="utf8", errors="strict"):
  if isinstance(s, unicode):
   return s
@@ -0,0 +1,163 @@
+# iosapplist
+# A Python package that lists iOS App Store apps.  (Formerly part of AppBackup.)
+#
+# Copyright (C) 2008-2014 Scott Zeid
+# https://s.zeid.me/projects/appbackup/
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# 
+# Except as contained in this notice, the name(s) of the above copyright holders
+# shall not be used in advertising or otherwise to promote the sale, use or
+# other dealings in this Software without prior written authorization.
+
+# File system traversal helpers
+
+"""Directory traversal helpers that keep the number of system calls low.
+
+scandir() lists a directory once and returns DirEntry objects whose is_dir(),
+is_file(), and stat() results are cached.  When os.scandir() (Python >= 3.5)
+or the scandir module is available, is_dir() and is_file() use the file type
+returned with the directory listing and usually make no system calls at all.
+
+The module-level syscalls object counts the file system calls made through
+this module (and by util.propertylist), so that the cost of a scan can be
+reported.
+
+"""
+
+from __future__ import with_statement
+
+import os
+import stat as stat_
+import threading
+
+try:
+ from os import scandir as _scandir
+except ImportError:
+ try:
+  from scandir import scandir as _scandir
+ except ImportError:
+  _scandir = None
+
+__all__ = ["DirEntry", "SyscallCounter", "isdir", "isfile", "listdir", "scandir"]
+__all__ += ["syscalls"]
+
+
+class SyscallCounter(object):
+ """Counts system calls by name (e.g. "scandir", "stat", or "open")."""
+ 
+ def __init__(self):
+  self.__lock   = threading.Lock()
+  self.__counts = {}
+ 
+ def add(self, name, n=1):
+  with self.__lock:
+   self.__counts[name] = self.__counts.get(name, 0) + n
+ 
+ def snapshot(self):
+  """Returns a dictionary of the current counts."""
+  with self.__lock:
+   return self.__counts.copy()
+ 
+ def since(self, snapshot):
+  """Returns a dictionary of the counts added since snapshot was taken."""
+  r = {}
+  for name, n in self.snapshot().iteritems():
+   n -= snapshot.get(name, 0)
+   if n:
+    r[name] = n
+  return r
+
+syscalls = SyscallCounter()
+
+
+class DirEntry(object):
+ """An entry in a directory listing returned by scandir().
+
+Attributes:
+ name: the entry's file name
+ path: the entry's full path
+
+"""
+ __slots__ = ["name", "path", "__entry", "__stat"]
+ 
+ def __init__(self, path, name, entry=None):
+  self.name    = name
+  self.path    = path
+  self.__entry = entry
+  self.__stat  = None
+ 
+ def __repr__(self):
+  return "<%s %s>" % (self.__class__.__name__, repr(self.name))
+ 
+ def stat(self):
+  """Returns the result of os.stat() for the entry, or None if that fails."""
+  if self.__stat is None:
+   syscalls.add("stat")
+   try:
+    self.__stat = os.stat(self.path)
+   except OSError:
+    self.__stat = False
+  return self.__stat or None
+ 
+ def is_dir(self):
+  """Returns True if the entry is (or is a symlink to) a directory."""
+  if self.__entry is not None and not self.__entry.is_symlink():
+   return self.__entry.is_dir()
+  st = self.stat()
+  return bool(st and stat_.S_ISDIR(st.st_mode))
+ 
+ def is_file(self):
+  """Returns True if the entry is (or is a symlink to) a regular file."""
+  if self.__entry is not None and not self.__entry.is_symlink():
+   return self.__entry.is_file()
+  st = self.stat()
+  return bool(st and stat_.S_ISREG(st.st_mode))
+
+
+def scandir(path):
+ """Lists the given directory and returns a list of DirEntry objects.
+
+The entries are in the same order as os.listdir() would return them.  Raises
+OSError if path can't be listed.
+
+"""
+ syscalls.add("scandir")
+ if _scandir is not None:
+  return [DirEntry(os.path.join(path, entry.name), entry.name, entry)
+          for entry in _scandir(path)]
+ return [DirEntry(os.path.join(path, name), name) for name in os.listdir(path)]
+
+
+def listdir(path):
+ """Like os.listdir(), but counted."""
+ syscalls.add("scandir")
+ return os.listdir(path)
+
+
+def isdir(path):
+ """Like os.path.isdir(), but counted."""
+ syscalls.add("stat")
+ return os.path.isdir(path)
+
+
+def isfile(path):
+ """Like os.path.isfile(), but counted."""
+ syscalls.add("stat")
+ return os.path.isfile(path)
@@ -0,0 +1,180 @@
+# iosapplist
+# A Python package that lists iOS App Store apps.  (Formerly part of AppBackup.)
+#
+# Copyright (C) 2008-2014 Scott Zeid
+# https://s.zeid.me/projects/appbackup/
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# 
+# Except as contained in this notice, the name(s) of the above copyright holders
+# shall not be used in advertising or otherwise to promote the sale, use or
+# other dealings in this Software without prior written authorization.
+
+# inotify wrapper
+
+"""A minimal ctypes wrapper around Linux's inotify API.
+
+Only what AppList.watch() needs is implemented:  watching directories and
+waiting until something happens in any of them.  The events themselves are
+not decoded.
+
+"""
+
+from __future__ import with_statement
+
+import errno
+import os
+import select
+
+try:
+ import ctypes
+ import ctypes.util
+except ImportError:
+ ctypes = None
+
+__all__ = ["Inotify", "InotifyError", "available"]
+
+
+IN_MODIFY      = 0x00000002
+IN_ATTRIB      = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF   = 0x00000800
+IN_ONLYDIR     = 0x01000000
+
+# The events that mean a directory's contents changed
+IN_DIR_CHANGES = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+                  IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ATTRIB)
+
+
+class InotifyError(Exception): pass
+
+
+_libc = None
+def _get_libc():
+ global _libc
+ if _libc is None:
+  # errno can only be read from ctypes in Python >= 2.6
+  if ctypes is None or not hasattr(ctypes, "get_errno"):
+   raise InotifyError("ctypes with errno support is not available")
+  name = ctypes.util.find_library("c")
+  if not name:
+   raise InotifyError("could not find the C library")
+  libc = ctypes.CDLL(name, use_errno=True)
+  if not hasattr(libc, "inotify_init") or not hasattr(libc, "inotify_add_watch"):
+   raise InotifyError("inotify is not available on this system")
+  libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+  libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+  _libc = libc
+ return _libc
+
+
+def available():
+ """Returns True if inotify can be used on this system."""
+ try:
+  _get_libc()
+  return True
+ except (InotifyError, OSError):
+  return False
+
+
+class Inotify(object):
+ """An inotify instance.
+
+Call add() to watch a directory, wait() to wait for changes, and close() when
+done.  Instances can also be used as context managers.
+
+"""
+ def __init__(self):
+  libc = _get_libc()
+  self.fd = libc.inotify_init()
+  if self.fd < 0:
+   e = ctypes.get_errno()
+   raise InotifyError(os.strerror(e))
+  self.__watches = {}
+ 
+ def __enter__(self):
+  return self
+ 
+ def __exit__(self, exc_type, exc_value, traceback):
+  self.close()
+ 
+ def add(self, path, mask=IN_DIR_CHANGES):
+  """Watches the given directory.  Does nothing if it is already watched."""
+  if isinstance(path, unicode):
+   path = path.encode("utf-8")
+  if path in self.__watches:
+   return
+  wd = _get_libc().inotify_add_watch(self.fd, path, mask | IN_ONLYDIR)
+  if wd < 0:
+   e = ctypes.get_errno()
+   if e in (errno.ENOENT, errno.ENOTDIR):
+    return
+   raise InotifyError("%s: %s" % (path, os.strerror(e)))
+  self.__watches[path] = wd
+ 
+ def forget(self, path):
+  """Stops watching the given path, e.g. after it was removed, so that it can
+be watched again by add()."""
+  if isinstance(path, unicode):
+   path = path.encode("utf-8")
+  wd = self.__watches.pop(path, None)
+  if wd is None:
+   return
+  if _get_libc().inotify_rm_watch(self.fd, wd) < 0:
+   # EINVAL means the kernel already dropped the watch (the path was removed)
+   e = ctypes.get_errno()
+   if e != errno.EINVAL:
+    raise InotifyError("%s: %s" % (path, os.strerror(e)))
+ 
+ def wait(self, timeout=None, settle=0.1):
+  """Waits for an event in any watched directory.
+
+Returns True if something changed, or False if timeout (in seconds) elapsed
+first.  Events that arrive within settle seconds of each other are treated as
+one change, so that e.g. an app installation only causes one wake-up.
+
+"""
+  if not self.__select(timeout):
+   return False
+  while True:
+   try:
+    os.read(self.fd, 65536)
+   except OSError, exc:
+    if exc.errno != errno.EINTR:
+     raise
+   if not self.__select(settle):
+    return True
+ 
+ def close(self):
+  if self.fd >= 0:
+   os.close(self.fd)
+   self.fd = -1
+ 
+ def __select(self, timeout):
+  while True:
+   try:
+    return bool(select.select([self.fd], [], [], timeout)[0])
+   except select.error, exc:
+    if exc.args[0] != errno.EINTR:
+     raise
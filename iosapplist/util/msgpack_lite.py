@@ -0,0 +1,187 @@
+# iosapplist
+# A Python package that lists iOS App Store apps.  (Formerly part of AppBackup.)
+#
+# Copyright (C) 2008-2014 Scott Zeid
+# https://s.zeid.me/projects/appbackup/
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# 
+# Except as contained in this notice, the name(s) of the above copyright holders
+# shall not be used in advertising or otherwise to promote the sale, use or
+# other dealings in this Software without prior written authorization.
+
+# MessagePack encoder and decoder
+
+"""A small MessagePack encoder and decoder for compact robot input and output.
+
+packb() encodes None, bools, integers, floats, strings, plistlib.Data objects,
+lists, tuples, and dictionaries.  str values are written as MessagePack strings
+(they should be in UTF-8, like everywhere else in this package), and
+plistlib.Data values as MessagePack binary values.  unpackb() decodes the same
+types, except that extension types are not supported.
+
+"""
+
+from __future__ import with_statement
+
+import plistlib
+import struct
+
+
+__all__ = ["packb", "unpackb"]
+
+
+def packb(value):
+ """Returns value encoded in MessagePack format."""
+ out = []
+ _pack(value, out.append, 0)
+ return "".join(out)
+
+
+def _pack(value, write, depth):
+ if depth > 512:
+  raise ValueError("the value is nested too deeply")
+ if value is None:
+  write("\xc0")
+ elif value is True:
+  write("\xc3")
+ elif value is False:
+  write("\xc2")
+ elif isinstance(value, (int, long)):
+  write(_int(value))
+ elif isinstance(value, float):
+  write(struct.pack(">Bd", 0xCB, value))
+ elif isinstance(value, basestring):
+  if isinstance(value, unicode):
+   value = value.encode("utf-8")
+  write(_header(len(value), 0xA0, 32, 0xD9, 0xDA, 0xDB))
+  write(value)
+ elif isinstance(value, plistlib.Data):
+  write(_header(len(value.data), None, 0, 0xC4, 0xC5, 0xC6))
+  write(value.data)
+ elif isinstance(value, (list, tuple)):
+  write(_header(len(value), 0x90, 16, None, 0xDC, 0xDD))
+  for i in value:
+   _pack(i, write, depth + 1)
+ elif isinstance(value, dict):
+  write(_header(len(value), 0x80, 16, None, 0xDE, 0xDF))
+  for k, v in value.iteritems():
+   _pack(k, write, depth + 1)
+   _pack(v, write, depth + 1)
+ else:
+  raise TypeError("%s is not MessagePack serializable" % repr(value))
+
+
+def _header(n, fix, fix_limit, type8, type16, type32):
+ # Returns the type and length of a string, binary value, array, or map
+ if n < fix_limit:
+  return chr(fix | n)
+ elif type8 is not None and n < 1 << 8:
+  return struct.pack(">BB", type8, n)
+ elif n < 1 << 16:
+  return struct.pack(">BH", type16, n)
+ elif n < 1 << 32:
+  return struct.pack(">BL", type32, n)
+ raise ValueError("the value is too long for MessagePack")
+
+
+def _int(n):
+ if 0 <= n < 0x80:
+  return chr(n)
+ elif -0x20 <= n < 0:
+  return chr(n & 0xFF)
+ elif n >= 0:
+  for fmt, code in ((">BB", 0xCC), (">BH", 0xCD), (">BL", 0xCE), (">BQ", 0xCF)):
+   if n < 1 << (struct.calcsize(fmt) - 1) * 8:
+    return struct.pack(fmt, code, n)
+ else:
+  for fmt, code in ((">Bb", 0xD0), (">Bh", 0xD1), (">Bl", 0xD2), (">Bq", 0xD3)):
+   if n >= -(1 << ((struct.calcsize(fmt) - 1) * 8 - 1)):
+    return struct.pack(fmt, code, n)
+ raise ValueError("integer is out of range for MessagePack: %d" % n)
+
+
+def unpackb(data):
+ """Returns the value of the MessagePack data in the given string.
+
+Strings and binary values are both returned as str objects (strings in UTF-8).
+Raises ValueError if data is not a single valid MessagePack value.
+
+"""
+ try:
+  value, end = _unpack(data, 0, 0)
+ except (IndexError, struct.error):
+  raise ValueError("the MessagePack data is truncated")
+ if end != len(data):
+  raise ValueError("there is extra data after the MessagePack value")
+ return value
+
+
+_FIXED = {
+ 0xCA: ">f", 0xCB: ">d",
+ 0xCC: ">B", 0xCD: ">H", 0xCE: ">L", 0xCF: ">Q",
+ 0xD0: ">b", 0xD1: ">h", 0xD2: ">l", 0xD3: ">q",
+}
+_LENGTHS = {
+ 0xC4: ">B", 0xC5: ">H", 0xC6: ">L", 0xD9: ">B", 0xDA: ">H", 0xDB: ">L",
+ 0xDC: ">H", 0xDD: ">L", 0xDE: ">H", 0xDF: ">L",
+}
+
+
+def _unpack(data, pos, depth):
+ # Returns the value at pos and the position after it
+ if depth > 512:
+  raise ValueError("the value is nested too deeply")
+ b = ord(data[pos])
+ pos += 1
+ if b <= 0x7F:
+  return b, pos
+ elif b >= 0xE0:
+  return b - 0x100, pos
+ elif b in (0xC0, 0xC2, 0xC3):
+  return {0xC0: None, 0xC2: False, 0xC3: True}[b], pos
+ elif b in _FIXED:
+  fmt = _FIXED[b]
+  return struct.unpack_from(fmt, data, pos)[0], pos + struct.calcsize(fmt)
+ if b in _LENGTHS:
+  fmt = _LENGTHS[b]
+  n = struct.unpack_from(fmt, data, pos)[0]
+  pos += struct.calcsize(fmt)
+  kind = {0xC4: 0xA0, 0xC5: 0xA0, 0xC6: 0xA0, 0xD9: 0xA0, 0xDA: 0xA0,
+          0xDB: 0xA0, 0xDC: 0x90, 0xDD: 0x90, 0xDE: 0x80, 0xDF: 0x80}[b]
+ elif 0x80 <= b <= 0xBF:
+  kind = b & 0xE0 if b >= 0xA0 else b & 0xF0
+  n = b & (0x1F if b >= 0xA0 else 0x0F)
+ else:
+  raise ValueError("unsupported MessagePack type: 0x%02X" % b)
+ if kind == 0xA0:
+  if pos + n > len(data):
+   raise IndexError()
+  return data[pos:pos + n], pos + n
+ elif kind == 0x90:
+  r = []
+  for i in xrange(n):
+   value, pos = _unpack(data, pos, depth + 1)
+   r.append(value)
+  return r, pos
+ r = {}
+ for i in xrange(n):
+  key, pos = _unpack(data, pos, depth + 1)
+  r[key], pos = _unpack(data, pos, depth + 1)
+ return r, pos
@@ -30,16 +30,168 @@
 
 """A module to work with binary or XML plists."""
 
+from __future__ import with_statement
+
+import copy
+import datetime
+import mmap
+import os
 import plistlib
+import struct
+import threading
 
+from contextlib import contextmanager
+from xml.parsers import expat as _expat
 from xml.parsers.expat import ExpatError
 
+try:
+ import multiprocessing
+except ImportError:
+ multiprocessing = None
+
 import CFPropertyList
 
+import fs
+
 class PropertyListError(Exception): pass
 
+
+class ParseCache(object):
+ """An LRU cache of decoded plist values.
+
+Entries are keyed by the absolute path of the file and are only used while the
+file's inode number, size, and modification time are unchanged.  At most
+max_size files are kept (0 turns the cache off), and reserve() raises that
+limit to fit a whole scan.  When the cache is full, the least recently used
+quarter of it is removed at once.  hits and misses count the lookups that were
+and were not served from the cache.  Values are deep-copied going in and out,
+so callers can change what they get back.
+
+An entry holds either a whole plist (from load()) or some of its top-level keys
+(from load_keys()).  While a scan is running, the top-level keys it will want
+can be given to wanting(), and load_keys() reads those too when it has to read
+a file, so that callers that want different keys from the same file (such as
+Container and App with legacy Info.plist files) only cause it to be read once.
+
+"""
+ def __init__(self, max_size=1024):
+  self.max_size = max_size
+  self.hits = 0
+  self.misses = 0
+  # maps file names to [signature, keys, value, last use]
+  self.__entries = {}
+  self.__clock = 0
+  self.__wanted_keys = {}
+  self.__lock = threading.Lock()
+ 
+ def __len__(self):
+  return len(self.__entries)
+ 
+ def clear(self):
+  """Removes all entries and resets the counters."""
+  with self.__lock:
+   self.__entries.clear()
+   self.hits = self.misses = 0
+ 
+ def get(self, filename, signature, keys=None):
+  """Returns the cached value for the file, or None if it is not cached.
+
+If keys is None, then the whole plist is returned; otherwise, a dictionary with
+each key in keys that is present in the plist is returned, as with load_keys().
+
+"""
+  filename = _preload_key(filename)
+  with self.__lock:
+   entry = self.__entries.get(filename, None)
+   if entry is not None and entry[0] == signature:
+    self.__clock += 1
+    entry[3] = self.__clock
+    entry_keys, value = entry[1:3]
+    if entry_keys is None:
+     self.hits += 1
+     return copy.deepcopy(value) if keys is None else _pick(value, keys)
+    elif keys is not None and entry_keys.issuperset(keys):
+     self.hits += 1
+     return _pick(value, keys)
+   self.misses += 1
+   return None
+ 
+ def put(self, filename, signature, value, keys=None):
+  """Caches a whole plist, or the given top-level keys from it."""
+  if not self.max_size:
+   return
+  filename = _preload_key(filename)
+  if keys is not None:
+   keys = frozenset(keys)
+  value = copy.deepcopy(value)
+  with self.__lock:
+   self.__clock += 1
+   self.__entries[filename] = [signature, keys, value, self.__clock]
+   if len(self.__entries) > self.max_size:
+    by_age = sorted(self.__entries.iteritems(), key=lambda item: item[1][3])
+    for name, entry in by_age[:len(by_age) - max(self.max_size * 3 // 4, 1)]:
+     del self.__entries[name]
+ 
+ def reserve(self, size):
+  """Makes room for at least size files (e.g. all of the plists that a scan
+will read) by raising max_size if needed.  Does nothing if the cache is off."""
+  with self.__lock:
+   if self.max_size and self.max_size < size:
+    self.max_size = size
+ 
+ @contextmanager
+ def wanting(self, keys):
+  """A context manager that makes load_keys() also read the given top-level
+keys whenever it reads a file, until the block is exited."""
+  keys = tuple(keys)
+  with self.__lock:
+   for key in keys:
+    self.__wanted_keys[key] = self.__wanted_keys.get(key, 0) + 1
+  try:
+   yield
+  finally:
+   with self.__lock:
+    for key in keys:
+     self.__wanted_keys[key] -= 1
+     if not self.__wanted_keys[key]:
+      del self.__wanted_keys[key]
+ 
+ def want(self, keys):
+  """Returns the given top-level keys plus the keys given to wanting() by any
+block that is still running."""
+  with self.__lock:
+   return tuple(set(keys).union(self.__wanted_keys))
+
+parse_cache = ParseCache()
+
+# the values given to preloaded(), per thread
+_preloaded = threading.local()
+
 def load(filename):
- """Reads a binary or XML plist from the given file name and returns its value."""
+ """Reads a binary or XML plist from the given file name and returns its value.
+
+If the file's value has been supplied with preloaded(), then a copy of that
+value is returned instead of reading the file.  Otherwise, parse_cache is used
+if the file has not changed since it was cached.
+
+"""
+ preloaded_values = getattr(_preloaded, "values", None)
+ if preloaded_values:
+  value = preloaded_values.get(_preload_key(filename), None)
+  if value is not None:
+   return copy.deepcopy(value)
+ signature = _signature(filename)
+ if signature is not None:
+  value = parse_cache.get(filename, signature)
+  if value is not None:
+   return value
+ value = _load(filename)
+ if signature is not None:
+  parse_cache.put(filename, signature, value)
+ return value
+
+def _load(filename):
+ fs.syscalls.add("open")
  cfplist = CFPropertyList.CFPropertyList(filename)
  cfplist.load()
  if cfplist.value != None:
@@ -51,6 +203,487 @@ def load(filename):
    raise PropertyListError(filename + " is not a valid binary or XML property"
                            " list file")
 
-def save(value, filename):
- """Writes a valid value for a plist as an XML plist with the given file name."""
- plistlib.writePlist(value, filename)
+def load_from_string(data):
+ """Returns the value of a binary or XML plist given as a string."""
+ if data.startswith("bplist00"):
+  try:
+   return _BinaryKeyReader(data).read_value()
+  except (_FallBack, IndexError, struct.error):
+   raise PropertyListError("the data is not a valid binary property list")
+ try:
+  return plistlib.readPlistFromString(data)
+ except ExpatError:
+  raise PropertyListError("the data is not a valid XML property list")
+
+def save(value, filename, binary=False):
+ """Writes a valid value for a plist as an XML plist with the given file name.
+
+If binary is True, then a binary plist is written instead.
+
+"""
+ if binary:
+  with open(filename, "wb") as f:
+   f.write(save_to_string(value, binary=True))
+ else:
+  plistlib.writePlist(value, filename)
+
+def save_to_string(value, binary=False):
+ """Returns a valid value for a plist as an XML or (if binary is True) binary plist.
+
+Binary plists are several times smaller than XML ones and faster to make.
+Strings and numbers that occur more than once are only stored once.  str
+values must be in UTF-8.
+
+"""
+ if binary:
+  return _BinaryWriter().write(value)
+ return plistlib.writePlistToString(value)
+
+def load_keys(filename, keys):
+ """Reads a plist like load(), but only returns the given top-level keys.
+
+The return value is a dictionary containing each key in keys that is present
+in the plist (or an empty dictionary if the plist is not a dictionary).  The
+values have the same types that load() would return.
+
+Only the requested keys are decoded.  The file is memory-mapped, and for binary
+plists, only the top-level dictionary and the requested values are read via the
+offset table.  XML plists are parsed with expat until all of the keys have been
+seen.  If the file cannot be read this way, then it is decoded in full with
+load() instead.  parse_cache is used like with load().
+
+"""
+ keys = tuple(keys)
+ preloaded_values = getattr(_preloaded, "values", None)
+ if preloaded_values:
+  value = preloaded_values.get(_preload_key(filename), None)
+  if value is not None:
+   return _pick(value, keys)
+ signature = _signature(filename)
+ if signature is None:
+  return _read_keys(filename, keys)
+ value = parse_cache.get(filename, signature, keys)
+ if value is None:
+  read_keys = parse_cache.want(keys)
+  value = _read_keys(filename, read_keys)
+  parse_cache.put(filename, signature, value, read_keys)
+  value = _pick(value, keys)
+ return value
+
+def _read_keys(filename, keys):
+ with open(filename, "rb") as f:
+  fs.syscalls.add("open")
+  try:
+   data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  except (mmap.error, ValueError):
+   data = None
+  if data is not None:
+   try:
+    if data[:8] == "bplist00":
+     return _BinaryKeyReader(data).read(keys)
+    elif not data[:6] == "bplist":
+     return _XMLKeyReader(data).read(keys)
+   except (_FallBack, ExpatError, struct.error, IndexError, ValueError,
+           OverflowError, TypeError, UnicodeError, RuntimeError):
+    pass
+   finally:
+    data.close()
+ return _pick(_load(filename), keys)
+
+def _signature(filename):
+ # Returns the key that parse_cache uses to tell if a file has changed, or None
+ # if the cache is turned off or the file cannot be stat()ed
+ if not parse_cache.max_size:
+  return None
+ try:
+  fs.syscalls.add("stat")
+  st = os.stat(filename)
+ except OSError:
+  return None
+ return (st.st_ino, st.st_size, getattr(st, "st_mtime_ns", st.st_mtime))
+
+def _pick(value, keys):
+ if not isinstance(value, dict):
+  return {}
+ return dict([(key, copy.deepcopy(value[key])) for key in keys if key in value])
+
+def load_many(filenames, keys, processes=None, batch_size=64):
+ """Reads many plists in a pool of worker processes.
+
+Each worker is sent batches of up to batch_size file names and returns only
+the given top-level keys from each file (see load_keys()), which keeps the cost
+of sending the results back to this process small.  processes is the size of
+the pool (defaults to the number of CPUs).
+
+Returns a dictionary mapping each file name to its value.  Files that do not
+exist or that are not valid plists are left out; callers that care about the
+reason can load those files themselves.
+
+"""
+ filenames = list(filenames)
+ batches = [(filenames[i:i + batch_size], tuple(keys))
+            for i in xrange(0, len(filenames), batch_size)]
+ if multiprocessing is None or processes == 1 or len(batches) <= 1:
+  results = map(_load_keys_batch, batches)
+ else:
+  pool = multiprocessing.Pool(processes)
+  try:
+   results = pool.map(_load_keys_batch, batches, 1)
+  finally:
+   pool.close()
+   pool.join()
+ r = {}
+ for batch in results:
+  r.update(batch)
+ return r
+
+def _load_keys_batch(args):
+ filenames, keys = args
+ r = []
+ for filename in filenames:
+  try:
+   if fs.isfile(filename):
+    r += [(filename, load_keys(filename, keys))]
+  except Exception:
+   pass
+ return r
+
+@contextmanager
+def preloaded(values):
+ """Makes load() return the given values instead of reading the files.
+
+values is a dictionary mapping file names to plist values, such as the one
+returned by load_many().  Only load() and load_keys() calls made inside the
+with block in the same thread are affected; use with_preloaded() to have
+functions that run in other threads (e.g. in a thread pool) use the values too.
+
+"""
+ values = dict([(_preload_key(k), v) for k, v in values.iteritems()])
+ with _using_preloaded(values):
+  yield
+
+def with_preloaded(func):
+ """Returns a function that calls func with the values given to preloaded() in
+the current thread (if any), in whichever thread it is called from."""
+ values = getattr(_preloaded, "values", None)
+ if not values:
+  return func
+ def wrapper(*args, **kwargs):
+  with _using_preloaded(values):
+   return func(*args, **kwargs)
+ return wrapper
+
+@contextmanager
+def _using_preloaded(values):
+ old = getattr(_preloaded, "values", None)
+ if old:
+  merged = dict(old)
+  merged.update(values)
+  values = merged
+ _preloaded.values = values
+ try:
+  yield
+ finally:
+  _preloaded.values = old
+
+class _FallBack(Exception): pass
+
+class _BinaryKeyReader(object):
+ # Decodes values from a binary plist (given as a string or mmap) on demand,
+ # with the same types that CFPropertyList.native_types() would give them
+ MAX_DEPTH = 512
+ 
+ def __init__(self, data):
+  self.data = data
+  trailer = data[-32:]
+  if len(trailer) != 32:
+   raise _FallBack()
+  (self.offset_size, self.ref_size, self.n_objects, self.top,
+   self.table_offset) = struct.unpack(">6xBBQQQ", trailer)
+  if not self.offset_size or not self.ref_size or self.top >= self.n_objects:
+   raise _FallBack()
+ 
+ def read(self, keys):
+  pos, type_, count = self.__header(self.top)
+  if type_ != 0xD:
+   return {}
+  r = {}
+  refs = self.__refs(pos, count * 2)
+  for i in xrange(count):
+   key = self.__value(refs[i], 1)
+   if key in keys and key not in r:
+    r[key] = self.__value(refs[count + i], 1)
+    if len(r) == len(keys):
+     break
+  return r
+ 
+ def read_value(self):
+  return self.__value(self.top, 0)
+ 
+ def __uint(self, pos, size):
+  raw = self.data[pos:pos + size]
+  if len(raw) != size:
+   raise _FallBack()
+  n = 0
+  for c in raw:
+   n = (n << 8) | ord(c)
+  return n
+ 
+ def __refs(self, pos, count):
+  size = self.ref_size
+  return [self.__uint(pos + i * size, size) for i in xrange(count)]
+ 
+ def __header(self, ref):
+  # Returns the position of an object's contents, its type, and its
+  # count (or the low nibble of its marker byte for null/bool/fill objects)
+  if ref >= self.n_objects:
+   raise _FallBack()
+  pos = self.__uint(self.table_offset + ref * self.offset_size, self.offset_size)
+  marker = ord(self.data[pos])
+  type_, count = marker >> 4, marker & 0xF
+  pos += 1
+  if type_ not in (0x0, 0x1, 0x2, 0x3) and count == 0xF:
+   size = 1 << (ord(self.data[pos]) & 0xF)
+   count = self.__uint(pos + 1, size)
+   pos += 1 + size
+  return pos, type_, count
+ 
+ def __value(self, ref, depth):
+  if depth > self.MAX_DEPTH:
+   raise _FallBack()
+  pos, type_, count = self.__header(ref)
+  data = self.data
+  if type_ == 0x0:
+   return {0x8: False, 0x9: True}.get(count, None)
+  elif type_ == 0x1:
+   size = 1 << count
+   n = self.__uint(pos, size)
+   if size >= 8 and n >> (size * 8 - 1):
+    n -= 1 << (size * 8)
+   return n
+  elif type_ in (0x2, 0x3):
+   if count == 2 and type_ == 0x2:
+    return struct.unpack(">f", data[pos:pos + 4])[0]
+   elif count == 3:
+    return struct.unpack(">d", data[pos:pos + 8])[0]
+   raise _FallBack()
+  elif type_ in (0x4, 0x5):
+   return data[pos:pos + count]
+  elif type_ == 0x6:
+   return data[pos:pos + count * 2].decode("utf-16be").encode("utf-8")
+  elif type_ == 0xA:
+   return [self.__value(i, depth + 1) for i in self.__refs(pos, count)]
+  elif type_ == 0xD:
+   refs = self.__refs(pos, count * 2)
+   r = {}
+   for i in xrange(count):
+    r[self.__value(refs[i], depth + 1)] = self.__value(refs[count + i], depth + 1)
+   return r
+  return None
+
+class _BinaryWriter(object):
+ # Encodes a value as a binary plist.  Each object is first given a reference
+ # number (with equal scalars sharing one), and then the objects are encoded in
+ # order with references of the smallest size that fits.
+ EPOCH = datetime.datetime(2001, 1, 1)
+ 
+ def __init__(self):
+  self.objects = []  # (marker and contents, child references or None)
+  self.uniques = {}
+ 
+ def write(self, value):
+  self.__flatten(value, 0)
+  n_objects = len(self.objects)
+  ref_size = self.__size(n_objects)
+  ref_format = {1: "B", 2: "H", 4: "L", 8: "Q"}[ref_size]
+  out = ["bplist00"]
+  offsets = []
+  pos = len(out[0])
+  for encoded, refs in self.objects:
+   offsets.append(pos)
+   if refs is not None:
+    encoded += struct.pack(">%d%s" % (len(refs), ref_format), *refs)
+   out.append(encoded)
+   pos += len(encoded)
+  offset_size = self.__size(pos + 1)
+  offset_format = {1: "B", 2: "H", 4: "L", 8: "Q"}[offset_size]
+  out.append(struct.pack(">%d%s" % (n_objects, offset_format), *offsets))
+  out.append(struct.pack(">6xBBQQQ", offset_size, ref_size, n_objects, 0, pos))
+  return "".join(out)
+ 
+ @staticmethod
+ def __size(n):
+  for size in (1, 2, 4):
+   if n < 1 << (size * 8):
+    return size
+  return 8
+ 
+ def __flatten(self, value, depth):
+  # Adds value (and anything in it) to self.objects and returns its reference
+  type_ = type(value)
+  if type_ in (str, unicode, int, bool):
+   key = (type_, value)
+  elif isinstance(value, (dict, list, tuple)):
+   if depth > _BinaryKeyReader.MAX_DEPTH:
+    raise PropertyListError("the value is nested too deeply")
+   ref = len(self.objects)
+   self.objects.append(None)
+   if isinstance(value, dict):
+    items = sorted(value.iteritems())
+    for key, v in items:
+     if not isinstance(key, basestring):
+      raise PropertyListError("dictionary keys must be strings")
+    refs = [self.__flatten(key, depth + 1) for key, v in items]
+    refs += [self.__flatten(v, depth + 1) for key, v in items]
+    self.objects[ref] = (self.__count(0xD, len(items)), refs)
+   else:
+    refs = [self.__flatten(v, depth + 1) for v in value]
+    self.objects[ref] = (self.__count(0xA, len(refs)), refs)
+   return ref
+  elif isinstance(value, plistlib.Data):
+   key = (plistlib.Data, value.data)
+  else:
+   key = (type_, value)
+  ref = self.uniques.get(key, None)
+  if ref is None:
+   ref = self.uniques[key] = len(self.objects)
+   self.objects.append((self.__scalar(value), None))
+  return ref
+ 
+ def __scalar(self, value):
+  if isinstance(value, basestring):
+   try:
+    if isinstance(value, str):
+     value.decode("ascii")
+    else:
+     value = value.encode("ascii")
+    return self.__count(0x5, len(value)) + value
+   except UnicodeError:
+    pass
+   try:
+    if isinstance(value, str):
+     value = value.decode("utf-8")
+   except UnicodeError:
+    raise PropertyListError("str values must be in UTF-8")
+   value = value.encode("utf-16be")
+   return self.__count(0x6, len(value) // 2) + value
+  elif value is None:
+   return "\x00"
+  elif isinstance(value, bool):
+   return "\x09" if value else "\x08"
+  elif isinstance(value, (int, long)):
+   return self.__int(value)
+  elif isinstance(value, float):
+   return struct.pack(">Bd", 0x23, value)
+  elif isinstance(value, datetime.datetime):
+   delta = value - self.EPOCH
+   seconds = delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
+   return struct.pack(">Bd", 0x33, seconds)
+  elif isinstance(value, plistlib.Data):
+   return self.__count(0x4, len(value.data)) + value.data
+  raise PropertyListError("%s objects cannot be stored in a plist"
+                          % type(value).__name__)
+ 
+ @staticmethod
+ def __int(n):
+  if n < 0:
+   if n < -(1 << 63):
+    raise PropertyListError("integer is too small for a plist: %d" % n)
+   return struct.pack(">Bq", 0x13, n)
+  elif n < 1 << 8:
+   return struct.pack(">BB", 0x10, n)
+  elif n < 1 << 16:
+   return struct.pack(">BH", 0x11, n)
+  elif n < 1 << 32:
+   return struct.pack(">BL", 0x12, n)
+  elif n < 1 << 63:
+   return struct.pack(">BQ", 0x13, n)
+  elif n < 1 << 64:
+   return struct.pack(">BQQ", 0x14, 0, n)
+  raise PropertyListError("integer is too large for a plist: %d" % n)
+ 
+ def __count(self, type_, count):
+  # Returns the marker for an object with the given type and count
+  if count < 0xF:
+   return chr((type_ << 4) | count)
+  return chr((type_ << 4) | 0xF) + self.__int(count)
+
+class _XMLKeyReader(object):
+ # Parses an XML plist with expat, building values with plistlib's parser, and
+ # stops as soon as all of the requested top-level keys have been seen
+ CHUNK_SIZE = 16384
+ 
+ class _Done(Exception): pass
+ 
+ def __init__(self, data):
+  self.data = data
+ 
+ def read(self, keys):
+  self.keys = keys
+  self.result = {}
+  self.depth = 0       # element depth, where 1 is <plist> and 2 is its value
+  self.top_dict = None # whether the top-level value is a dictionary
+  self.in_key = False
+  self.key = None
+  self.text = []
+  self.value = None    # a plistlib parser for the value being decoded
+  self.value_depth = None
+  parser = _expat.ParserCreate()
+  parser.StartElementHandler = self.start
+  parser.EndElementHandler = self.end
+  parser.CharacterDataHandler = self.text_data
+  data = self.data
+  try:
+   for i in xrange(0, len(data), self.CHUNK_SIZE):
+    parser.Parse(data[i:i + self.CHUNK_SIZE], False)
+   parser.Parse("", True)
+  except self._Done:
+   pass
+  if self.top_dict is None:
+   raise _FallBack()
+  return self.result
+ 
+ def start(self, name, attrs):
+  self.depth += 1
+  if self.value is not None:
+   self.value.handleBeginElement(name, attrs)
+  elif self.depth == 2:
+   self.top_dict = (name == "dict")
+   if not self.top_dict:
+    raise self._Done()
+  elif self.depth == 3:
+   if name == "key":
+    self.in_key = True
+    self.text = []
+   elif self.key in self.keys and self.key not in self.result:
+    self.value = plistlib.PlistParser()
+    self.value_depth = self.depth
+    self.value.handleBeginElement(name, attrs)
+ 
+ def end(self, name):
+  if self.value is not None:
+   self.value.handleEndElement(name)
+   if self.depth == self.value_depth:
+    self.result[self.key] = self.value.root
+    self.value = None
+    if len(self.result) == len(self.keys):
+     raise self._Done()
+  elif self.in_key and self.depth == 3:
+   self.in_key = False
+   self.key = "".join(self.text)
+   try:
+    self.key = self.key.encode("ascii")
+   except UnicodeError:
+    pass
+  self.depth -= 1
+ 
+ def text_data(self, data):
+  if self.value is not None:
+   self.value.handleData(data)
+  elif self.in_key:
+   self.text.append(data)
+
+def _preload_key(filename):
+ if isinstance(filename, str):
+  filename = filename.decode("utf-8", "replace")
+ return os.path.abspath(filename)
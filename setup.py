@@ -33,6 +33,7 @@ setup(
  ],
  packages=find_packages(),
  install_requires=["argparse", "CFPropertyList", "simplejson"],
+ extras_require={"scandir": ["scandir"]},
  entry_points={
   "console_scripts": [
     "iosapplist=iosapplist:main"